@@ -0,0 +1,74 @@
+"""
+CPU cost versus bytes saved for each compression codec and level.
+
+    $ python benchmarks/bench_compression.py --scale 10000 --limit 1000
+
+Compresses a real /characters page (and a /characters/<id> body) with every
+available codec (gzip, and br / zstd when installed) at each level. Reports
+milliseconds per compression, compression ratio and bytes saved per CPU ms.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import seed, use_database
+
+
+def codecs():
+    from compression import brotli, zstandard
+    yield "gzip", range(1, 10), lambda data, level: gzip.compress(data, compresslevel=level, mtime=0)
+    if brotli is not None:
+        yield "br", range(0, 12), lambda data, level: brotli.compress(data, quality=level)
+    if zstandard is not None:
+        yield "zstd", (1, 3, 6, 9, 12, 15, 19), lambda data, level: zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def measure(body, name, level, compress, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        compressed = compress(body, level)
+    cpu_ms = (time.perf_counter() - start) * 1000 / repeat
+    saved = len(body) - len(compressed)
+    return {"codec": name, "level": level, "bytes_in": len(body), "bytes_out": len(compressed),
+            "ratio": round(len(body) / len(compressed), 2), "cpu_ms": round(cpu_ms, 3),
+            "bytes_saved_per_cpu_ms": round(saved / cpu_ms) if cpu_ms else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench_compression.db")
+    parser.add_argument("--scale", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_database(args.db)
+    os.environ.setdefault("PAGE_MAX_LIMIT", str(args.limit))
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    from app import app
+    from models import db
+
+    seed(app, db, args.scale, 1, 1, 0)
+    client = app.test_client()
+    bodies = {
+        "characters_page": client.get("/characters?limit=%d" % args.limit).get_data(),
+        "character_detail": client.get("/characters/1").get_data(),
+    }
+
+    report = {}
+    for body_name, body in bodies.items():
+        report[body_name] = [measure(body, name, level, compress, args.repeat)
+                             for name, levels, compress in codecs() for level in levels]
+    print(json.dumps(report, indent=2))
+    os.remove(args.db)
+
+
+if __name__ == "__main__":
+    main()
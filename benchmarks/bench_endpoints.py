@@ -0,0 +1,230 @@
+"""
+Benchmark of every route in src/app.py against a seeded SQLite database.
+
+    $ python benchmarks/bench_endpoints.py --scale 10000 --requests 200 --processes 4 --duration 10
+
+1. Seeds --db with benchmarks/seed.py (skip with --no-seed to reuse it).
+2. Calls each route --requests times through the Flask test client and
+   records latency percentiles, SQL statements per request and status codes.
+3. Runs the read mix from --processes processes for --duration seconds and
+   reports the aggregated throughput.
+
+The report is JSON (stdout or --output) so runs on different commits can be
+diffed; anything the app prints during the run goes to stderr. Peak RSS is reported for this process and for the load processes.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import PASSWORD, seed, use_database
+
+
+def scenarios(scale):
+    """(name, method, path(i), json(i), needs_token) for every route of app.py."""
+    some = lambda i: i % scale + 1
+    return [
+        ("sitemap", "GET", lambda i: "/", None, False),
+        ("get_all_characters", "GET", lambda i: "/characters", None, False),
+        ("get_all_characters_fields", "GET", lambda i: "/characters?fields=name,gender", None, False),
+        ("get_all_characters_stream", "GET", lambda i: "/characters?stream=1", None, False),
+        ("get_one_characters", "GET", lambda i: "/characters/%d" % some(i), None, False),
+        ("get_all_planets", "GET", lambda i: "/planets", None, False),
+        ("get_one_planets", "GET", lambda i: "/planets/%d" % some(i), None, False),
+        ("get_all_users", "GET", lambda i: "/users", None, False),
+        ("get_single_user", "GET", lambda i: "/users/%d" % some(i), lambda i: {}, False),
+        ("get_favoritos", "GET", lambda i: "/users/%d/favoritos" % some(i), None, False),
+        ("get_favoritos_all", "GET", lambda i: "/users/%d/favoritos?all=true" % some(i), None, False),
+        ("get_metrics", "GET", lambda i: "/metrics", None, False),
+        ("get_cache_stats", "GET", lambda i: "/cache/stats", None, False),
+        ("get_profile", "GET", lambda i: "/profile", None, True),
+        ("login", "POST", lambda i: "/login", lambda i: {"email": "user1@example.com", "password": PASSWORD}, False),
+        ("create_user", "POST", lambda i: "/users",
+         lambda i: {"email": "bench%d.%d@example.com" % (os.getpid(), i), "password": "x", "is_active": True}, False),
+        ("add_favorito", "POST", lambda i: "/users/%d/favoritos/" % some(i),
+         lambda i: {"characters_id": None, "planets_id": some(i * 13)}, False),
+        ("del_favorito", "DELETE", lambda i: "/users/%d/favoritos/" % some(i),
+         lambda i: {"characters_id": None, "planets_id": some(i * 13)}, False),
+        ("add_favoritos_batch", "POST", lambda i: "/users/%d/favoritos/batch" % some(i),
+         lambda i: [{"characters_id": None, "planets_id": some(i * 17 + k)} for k in range(10)], False),
+        ("del_favoritos_batch", "DELETE", lambda i: "/users/%d/favoritos/batch" % some(i),
+         lambda i: [{"characters_id": None, "planets_id": some(i * 17 + k)} for k in range(10)], False),
+        ("update_user", "PUT", lambda i: "/users/%d" % some(i), lambda i: {"email": "user%d@example.com" % some(i)}, False),
+    ]
+
+
+READ_MIX = ("get_all_characters", "get_one_characters", "get_all_planets", "get_one_planets",
+            "get_favoritos_all", "get_profile")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def load_app():
+    from sqlalchemy import event
+    from app import app
+    from models import db
+
+    counter = {"queries": 0}
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*args):
+        counter["queries"] += 1
+
+    return app, counter
+
+
+def login(client):
+    response = client.post("/login", json={"email": "user1@example.com", "password": PASSWORD})
+    return {"Authorization": "Bearer " + response.get_json()["access_token"]}
+
+
+def call(client, scenario, i, headers):
+    name, method, path, body, needs_token = scenario
+    kwargs = {"headers": headers if needs_token else {}}
+    if body is not None:
+        kwargs["json"] = body(i)
+    response = client.open(path(i), method=method, **kwargs)
+    size = len(response.get_data())
+    response.close()
+    return response.status_code, size
+
+
+def bench_routes(scale, requests):
+    app, counter = load_app()
+    client = app.test_client()
+    headers = login(client)
+    results = []
+    for scenario in scenarios(scale):
+        latencies, statuses, queries, size = [], {}, 0, 0
+        for i in range(requests):
+            before = counter["queries"]
+            start = time.perf_counter()
+            status, size = call(client, scenario, i, headers)
+            latencies.append(time.perf_counter() - start)
+            queries += counter["queries"] - before
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result = {"route": scenario[0], "requests": requests,
+                  "requests_per_sec": round(requests / sum(latencies), 1),
+                  "queries_per_request": round(queries / requests, 2),
+                  "response_bytes": size, "statuses": statuses}
+        result.update(summarize(latencies))
+        results.append(result)
+    return results
+
+
+def load_worker(args):
+    scale, duration, seed_offset = args
+    app, counter = load_app()
+    client = app.test_client()
+    headers = login(client)
+    mix = [scenario for scenario in scenarios(scale) if scenario[0] in READ_MIX]
+    latencies, errors, i = [], 0, seed_offset
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, _ = call(client, mix[i % len(mix)], i, headers)
+        latencies.append(time.perf_counter() - start)
+        errors += status >= 500
+        i += 1
+    return latencies, errors, counter["queries"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_load(scale, processes, duration):
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(load_worker, [(scale, duration, n * 100003) for n in range(processes)])
+    latencies = [latency for result in results for latency in result[0]]
+    report = {"processes": processes, "duration_s": duration, "requests": len(latencies),
+              "requests_per_sec": round(len(latencies) / duration, 1),
+              "errors": sum(result[1] for result in results),
+              "queries_per_request": round(sum(result[2] for result in results) / max(len(latencies), 1), 2),
+              "peak_rss_kb_per_process": max(result[3] for result in results)}
+    report.update(summarize(latencies))
+    return report
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    # los print() de la app (y de los procesos de carga, que heredan el fd 1)
+    # no deben mezclarse con el informe JSON
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench.db")
+    parser.add_argument("--scale", type=int, default=1000, help="rows per table, 1000 to 1000000")
+    parser.add_argument("--favorites-per-user", type=int, default=5)
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    use_database(args.db)
+    # coste bajo: medimos la API, no el KDF (ver bench_passwords.py)
+    os.environ.setdefault("PASSWORD_HASH_ITERATIONS", "1000")
+    # sin limitador: si no, la carga mide sobre todo respuestas 429
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+
+    report = {"revision": git_revision(), "scale": args.scale}
+    with stdout_to_stderr():
+        if not args.no_seed:
+            from app import app
+            from models import db
+            start = time.perf_counter()
+            report["seed"] = {"rows": seed(app, db, args.scale, args.scale, args.scale, args.favorites_per_user),
+                              "seconds": round(time.perf_counter() - start, 2)}
+
+        report["routes"] = bench_routes(args.scale, args.requests)
+        if args.processes > 0:
+            report["load"] = bench_load(args.scale, args.processes, args.duration)
+    report["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
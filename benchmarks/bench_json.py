@@ -0,0 +1,68 @@
+"""
+Encoding throughput of /characters with each JSON path.
+
+    $ python benchmarks/bench_json.py --scale 10000 --limit 1000 --requests 200
+
+Compares the stdlib provider with a dict per row (the original code path),
+the row encoder that writes JSON straight from the column tuples, and the
+orjson provider with a dict per row (when orjson is installed). Reports
+requests/sec and bytes/sec; --limit is the page size served.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import seed, use_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench_json.db")
+    parser.add_argument("--scale", type=int, default=10000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--fields", help="only encode these columns, as ?fields=")
+    args = parser.parse_args()
+
+    use_database(args.db)
+    os.environ.setdefault("PAGE_MAX_LIMIT", str(args.limit))
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    from flask.json.provider import DefaultJSONProvider
+    from app import app
+    from encoding import OrjsonProvider, orjson
+    from models import db
+
+    seed(app, db, args.scale, 1, 1, 0)
+    client = app.test_client()
+    path = "/characters?limit=%d" % args.limit + ("&fields=" + args.fields if args.fields else "")
+
+    modes = [("stdlib_dicts", DefaultJSONProvider, False), ("row_encoder", DefaultJSONProvider, True)]
+    if orjson is not None:
+        modes.append(("orjson_dicts", OrjsonProvider, False))
+
+    results = []
+    for name, provider, row_encoder in modes:
+        app.json = provider(app)
+        app.config["JSON_ROW_ENCODER"] = row_encoder
+        client.get(path)
+        size = 0
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            size += len(client.get(path).get_data())
+        elapsed = time.perf_counter() - start
+        results.append({"mode": name, "rows_per_response": args.limit,
+                        "requests_per_sec": round(args.requests / elapsed, 1),
+                        "mbytes_per_sec": round(size / elapsed / 1e6, 2)})
+
+    print(json.dumps(results, indent=2))
+    os.remove(args.db)
+
+
+if __name__ == "__main__":
+    main()
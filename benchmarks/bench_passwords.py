@@ -0,0 +1,57 @@
+"""
+Logins/sec per worker for each password hashing cost.
+
+    $ python benchmarks/bench_passwords.py --iterations 100000 300000 600000 --threads 8
+
+For every cost it reports the time of one verification and the throughput of
+a burst of concurrent logins going through PasswordHasher's bounded pool.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from passwords import PasswordHasher, check_password, hash_password
+
+
+def bench_cost(iterations, threads, workers, logins):
+    stored = hash_password("correct horse", iterations)
+
+    start = time.perf_counter()
+    check_password("correct horse", stored)
+    single = time.perf_counter() - start
+
+    hasher = PasswordHasher(iterations=iterations, workers=workers, max_pending=threads)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: hasher.verify("correct horse", stored), range(logins)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "iterations": iterations,
+        "verify_ms": round(single * 1000, 2),
+        "pool_workers": workers,
+        "client_threads": threads,
+        "logins": logins,
+        "logins_per_sec": round(logins / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100000, 300000, 600000, 1000000])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--logins", type=int, default=40)
+    args = parser.parse_args()
+
+    results = [bench_cost(iterations, args.threads, args.workers, args.logins) for iterations in args.iterations]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
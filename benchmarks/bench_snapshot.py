@@ -0,0 +1,129 @@
+"""
+Catalog snapshot: memory per 100k rows, refresh time, and requests/sec and
+SQL statements per request of the catalog endpoints with and without it.
+
+    $ python benchmarks/bench_snapshot.py --rows 100000 --requests 2000
+
+Memory is measured with tracemalloc for the same characters held as the
+snapshot's columns, as serialize() dicts and as ORM instances. The refresh
+times are the first full load and an incremental refresh after --updated
+rows change. The endpoint numbers come from one process, with the snapshot
+switched off by taking it out of app.extensions.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import seed, use_database
+
+
+def allocated(build):
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def per_100k(size, rows):
+    return round(size * 100000 / rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench_snapshot.db")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--updated", type=int, default=100)
+    args = parser.parse_args()
+
+    use_database(args.db)
+    os.environ["RATELIMIT_ENABLED"] = "0"
+    os.environ["CATALOG_SNAPSHOT_INTERVAL"] = "3600"
+    from sqlalchemy import event
+    from app import app
+    from models import db, Character
+    from snapshot import Columns, select_rows
+    from utils import encode_cursor, version_statement
+
+    seed(app, db, args.rows, args.rows // 10, 10, 1)
+    snapshot = app.extensions["catalog_snapshot"]
+    results = {"rows": args.rows}
+
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            version = tuple(connection.execute(version_statement(Character)).one())
+            # lo que queda vivo tras construir cada forma, valores incluidos
+            _, columns_size = allocated(lambda: Columns.from_rows(Character, select_rows(connection, Character),
+                                                                  version))
+            _, dicts_size = allocated(lambda: [dict(zip(Character.serialize_fields, row))
+                                               for row in select_rows(connection, Character)])
+        _, orm_size = allocated(lambda: db.session.query(Character).all())
+        db.session.remove()
+    results["memory_bytes_per_100k_rows"] = {
+        "snapshot_columns": per_100k(columns_size, args.rows),
+        "serialize_dicts": per_100k(dicts_size, args.rows),
+        "orm_instances": per_100k(orm_size, args.rows),
+    }
+
+    with app.app_context():
+        start = time.perf_counter()
+        snapshot.tables.clear()
+        snapshot.mark_stale()
+        snapshot.table(Character)
+        full = time.perf_counter() - start
+
+        for entity_id in random.Random(1).sample(range(1, args.rows + 1), args.updated):
+            db.session.get(Character, entity_id).eye_color = "grey"
+        db.session.commit()
+        start = time.perf_counter()
+        snapshot.table(Character)
+        incremental = time.perf_counter() - start
+        results["refresh_ms"] = {"full": round(full * 1000, 1),
+                                 "incremental_%d_rows" % args.updated: round(incremental * 1000, 1)}
+        results["snapshot_stats"] = snapshot.stats()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(1))
+    client = app.test_client()
+    rng = random.Random(2)
+    urls = {
+        "list_page": lambda: "/characters?limit=100&after=%s" % encode_cursor(rng.randint(1, args.rows - 100)),
+        "detail": lambda: "/characters/%d" % rng.randint(1, args.rows),
+    }
+
+    results["endpoints"] = {}
+    for mode in ("snapshot", "database"):
+        if mode == "database":
+            app.extensions.pop("catalog_snapshot")
+        for name, url in urls.items():
+            app.extensions["cache"].clear()
+            del statements[:]
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.get(url())
+            elapsed = time.perf_counter() - start
+            results["endpoints"]["%s_%s" % (name, mode)] = {
+                "requests_per_sec": round(args.requests / elapsed, 1),
+                "statements_per_request": round(len(statements) / args.requests, 2),
+            }
+
+    print(json.dumps(results, indent=2))
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold start of a worker: import time and time to first response.
+
+    $ python benchmarks/bench_startup.py --runs 5
+
+Starts a fresh interpreter per run, the way gunicorn boots a worker, and
+imports src/wsgi.py under `python -X importtime`. Reports the total import
+time, the packages that take longest to import, and the time from interpreter
+start to the first GET /characters/1 answered. Runs once with every component loaded
+at startup (ADMIN=on MIGRATIONS=on, the old behaviour) and once with the
+defaults (lazy admin, no migrations outside the flask command). The schema
+and the character are created before any timed run, which must answer 200.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+SETUP = """
+from wsgi import application
+from models import db, Character
+with application.app_context():
+    db.create_all()
+    if db.session.get(Character, 1) is None:
+        db.session.add(Character(id=1, name="Luke Skywalker"))
+        db.session.commit()
+"""
+
+CHILD = """
+import time
+start = time.perf_counter()
+from wsgi import application
+imported = time.perf_counter()
+status = application.test_client().get("/characters/1").status_code
+print(imported - start, time.perf_counter() - start, status)
+"""
+
+CONFIGURATIONS = {
+    "eager": {"ADMIN": "on", "MIGRATIONS": "on"},
+    "lazy": {"ADMIN": "lazy", "MIGRATIONS": "auto"},
+}
+
+
+def parse_importtime(stderr, top):
+    """Total import milliseconds, and the heaviest packages by self time, from -X importtime."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return sum(packages.values()) / 1000, [{"package": name, "ms": round(us / 1000, 1)} for name, us in heaviest]
+
+
+def run(env, top):
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD], cwd=SRC, env=env,
+                           capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    import_s, first_response_s, status = child.stdout.split()[-3:]
+    if int(status) != 200:
+        raise SystemExit("GET /characters/1 answered %s" % status)
+    total_ms, heaviest = parse_importtime(child.stderr, top)
+    return {"importtime_total_ms": total_ms, "import_app_ms": float(import_s) * 1000,
+            "first_response_ms": float(first_response_s) * 1000, "process_to_first_response_ms": wall * 1000,
+            "status": int(status), "heaviest_imports": heaviest}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench_startup.db")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest packages to list")
+    args = parser.parse_args()
+
+    # fuera de lo medido: el esquema y la fila que pide la primera respuesta
+    subprocess.run([sys.executable, "-c", SETUP], cwd=SRC, env=dict(os.environ, DATABASE_URL="sqlite:///" + args.db),
+                   check=True)
+
+    report = {}
+    for name, components in CONFIGURATIONS.items():
+        env = dict(os.environ, DATABASE_URL="sqlite:///" + args.db, **components)
+        runs = [run(env, args.top) for _ in range(args.runs)]
+        summary = {key: round(statistics.median(r[key] for r in runs), 1)
+                   for key in ("importtime_total_ms", "import_app_ms", "first_response_ms",
+                               "process_to_first_response_ms")}
+        summary["status"] = runs[-1]["status"]
+        summary["heaviest_imports"] = runs[-1]["heaviest_imports"]
+        report[name] = summary
+
+    print(json.dumps(report, indent=2))
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+
+if __name__ == "__main__":
+    main()
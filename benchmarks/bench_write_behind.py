@@ -0,0 +1,137 @@
+"""
+Favorite writes: requests/sec and commits/sec, with and without write-behind.
+
+    $ python benchmarks/bench_write_behind.py --requests 4000 --threads 8
+
+Each mode runs in its own process on a fresh SQLite file: --threads clients
+send POST and DELETE /users/<id>/favoritos/ (each thread owns its users, so
+the final table is known), with a GET of the user's favorites every
+--read-every writes. Reports requests/sec, the transactions committed on the
+database and commits/sec, and checks that the favorites left in the table
+(after the write-behind queue is flushed on close) are the expected ones.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from seed import seed, use_database
+
+
+def workload(thread, threads, users, characters, requests, seed_value):
+    # usuarios thread, thread + threads, ...: ningun otro hilo los toca
+    rng = random.Random(seed_value + thread)
+    owned = list(range(thread + 1, users + 1, threads))
+    state = dict((user, set()) for user in owned)
+    operations = []
+    for _ in range(requests):
+        user = rng.choice(owned)
+        character = rng.randint(1, characters)
+        present = character not in state[user]
+        (state[user].add if present else state[user].discard)(character)
+        operations.append((user, character, present))
+    return operations, state
+
+
+def run_mode(args):
+    path = "/tmp/bench_write_behind_%s.db" % args.mode
+    use_database(path)
+    os.environ["FAVORITOS_WRITE_BEHIND"] = "1" if args.mode == "write-behind" else "0"
+    os.environ["FAVORITOS_FLUSH_MS"] = str(args.flush_ms)
+    os.environ["FAVORITOS_FLUSH_ITEMS"] = str(args.flush_items)
+    os.environ["RATELIMIT_ENABLED"] = "0"
+    from sqlalchemy import event
+    from app import app
+    from models import db, Favorito
+
+    seed(app, db, args.characters, 1, args.users, 0)
+    with app.app_context():
+        engine = db.engine
+    commits = []
+    event.listen(engine, "commit", lambda connection: commits.append(1))
+
+    per_thread = args.requests // args.threads
+    plans = [workload(thread, args.threads, args.users, args.characters, per_thread, args.seed)
+             for thread in range(args.threads)]
+
+    def client(plan):
+        operations, _ = plan
+        http = app.test_client()
+        errors = 0
+        for i, (user, character, present) in enumerate(operations, 1):
+            body = {"characters_id": character, "planets_id": None}
+            response = http.post("/users/%d/favoritos/" % user, json=body) if present \
+                else http.delete("/users/%d/favoritos/" % user, json=body)
+            errors += response.status_code >= 300
+            if args.read_every and i % args.read_every == 0:
+                http.get("/users/%d/favoritos?all=true" % user)
+        return errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        errors = sum(pool.map(client, plans))
+    elapsed = time.perf_counter() - start
+    write_commits = len(commits)
+
+    queue = app.extensions.get("favoritos_write_behind")
+    if queue is not None:
+        queue.close()
+    expected = set((user, character) for _, state in plans for user, characters in state.items()
+                   for character in characters)
+    with app.app_context():
+        stored = set(db.session.query(Favorito.user_id, Favorito.characters_id))
+
+    writes = per_thread * args.threads
+    reads = writes // args.read_every if args.read_every else 0
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return {
+        "mode": args.mode,
+        "write_requests": writes,
+        "read_requests": reads,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round((writes + reads) / elapsed, 1),
+        "commits": write_commits,
+        "commits_per_sec": round(write_commits / elapsed, 1),
+        "requests_per_commit": round(writes / write_commits, 1) if write_commits else None,
+        "final_state_ok": stored == expected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--characters", type=int, default=50)
+    parser.add_argument("--read-every", type=int, default=20)
+    parser.add_argument("--flush-ms", type=int, default=50)
+    parser.add_argument("--flush-items", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mode", choices=["sync", "write-behind"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    results = []
+    for mode in ("sync", "write-behind"):
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode] + sys.argv[1:],
+                               capture_output=True, text=True, check=True)
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Load test of the read endpoints served by gunicorn (wsgi.py) and by uvicorn
+(asgi.py) with the same number of worker processes.
+
+    $ python benchmarks/load_wsgi_vs_asgi.py --workers 2 --concurrency 64 --duration 15
+
+Uses the database configured in DATABASE_URL, seeded beforehand (see
+benchmarks/seed.py). Every client keeps one HTTP/1.1 connection open and requests the paths in a loop;
+the report is JSON with requests/sec and p50/p95/p99 latency for each mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PATHS = ["/characters?limit=50", "/planets?limit=50", "/users/1/favoritos?all=true"]
+
+SERVERS = {
+    "wsgi": ["gunicorn", "wsgi", "--chdir", "./src/", "--workers", "{workers}", "--bind", "127.0.0.1:{port}"],
+    "asgi": ["uvicorn", "asgi:application", "--app-dir", "./src/", "--workers", "{workers}", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def fetch(reader, writer, path):
+    writer.write(("GET %s HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n" % path).encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def client(port, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    index = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            status = await fetch(reader, writer, PATHS[index % len(PATHS)])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            errors.append(1)
+            writer.close()
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            continue
+        if status >= 500:
+            errors.append(status)
+        latencies.append(time.perf_counter() - start)
+        index += 1
+    writer.close()
+
+
+async def run_load(port, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client(port, deadline, latencies, errors) for _ in range(concurrency)])
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_sec": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), 1))
+            return
+        except (OSError, asyncio.TimeoutError):
+            time.sleep(0.2)
+    raise RuntimeError("server on port %d did not start" % port)
+
+
+def bench_mode(mode, args, port):
+    command = [part.format(workers=args.workers, port=port) for part in SERVERS[mode]]
+    server = subprocess.Popen(command, cwd=ROOT)
+    try:
+        wait_until_ready(port)
+        result = asyncio.run(run_load(port, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+    result.update({"mode": mode, "workers": args.workers, "concurrency": args.concurrency})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--modes", nargs="+", default=["wsgi", "asgi"], choices=sorted(SERVERS))
+    args = parser.parse_args()
+
+    # los servidores heredan el entorno: sin limitador, se mide la API y no los 429
+    os.environ.setdefault("RATELIMIT_ENABLED", "0")
+    results = [bench_mode(mode, args, args.port + offset) for offset, mode in enumerate(args.modes)]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
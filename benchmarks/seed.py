@@ -0,0 +1,97 @@
+"""
+Fills a database with synthetic characters, planets, users and favorites.
+
+    $ python benchmarks/seed.py --db /tmp/bench.db --scale 100000
+
+--scale sets the number of characters, planets and users; each user gets
+--favorites-per-user favorites. Rows go in with executemany in batches, so
+seeding 1M rows takes seconds and constant memory. The schema is created
+with db.create_all() (the database is recreated from scratch).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+CLIMATES = ("arid", "temperate", "tropical", "frozen", "murky", "windy")
+GENDERS = ("male", "female", "n/a", "hermaphrodite")
+COLORS = ("blue", "brown", "yellow", "red", "green", "white", "black")
+PASSWORD = "benchmark"
+
+
+def use_database(path):
+    # antes de importar app, que lee DATABASE_URL al arrancar
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(path)
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(app, db, characters, planets, users, favorites_per_user, batch_size=10000):
+    from models import Character, Planet, User, Favorito
+    from passwords import hash_password
+
+    password = hash_password(PASSWORD, app.config["PASSWORD_HASH_ITERATIONS"])
+    favorites_per_user = min(favorites_per_user, characters)
+    tables = (
+        (Character, ({"name": "Character %d" % i, "birth_year": i % 900, "gender": GENDERS[i % len(GENDERS)],
+                      "height": 50 + i % 200, "skin_color": COLORS[i % len(COLORS)],
+                      "eye_color": COLORS[(i * 3) % len(COLORS)]} for i in range(1, characters + 1))),
+        (Planet, ({"name": "Planet %d" % i, "climate": CLIMATES[i % len(CLIMATES)], "population": i * 1000,
+                   "orbital_period": 100 + i % 500, "rotation_period": 10 + i % 40,
+                   "diameter": 1000 + i % 20000} for i in range(1, planets + 1))),
+        (User, ({"email": "user%d@example.com" % i, "password": password, "is_active": True}
+                for i in range(1, users + 1))),
+        # personajes distintos por usuario, respeta el indice unico
+        (Favorito, ({"user_id": user, "characters_id": (user * 7 + k) % characters + 1,
+                     "planets_id": (user + k) % planets + 1 if planets else None}
+                    for user in range(1, users + 1) for k in range(favorites_per_user))),
+    )
+
+    counts = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for model, rows in tables:
+            counts[model.__tablename__] = 0
+            for batch in batched(rows, batch_size):
+                db.session.execute(db.insert(model), batch)
+                counts[model.__tablename__] += len(batch)
+            db.session.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default="/tmp/bench.db")
+    parser.add_argument("--scale", type=int, default=1000)
+    parser.add_argument("--characters", type=int)
+    parser.add_argument("--planets", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--favorites-per-user", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    use_database(args.db)
+    from app import app
+    from models import db
+
+    start = time.perf_counter()
+    counts = seed(app, db, args.characters or args.scale, args.planets or args.scale, args.users or args.scale,
+                  args.favorites_per_user, args.batch_size)
+    print(json.dumps({"db": args.db, "rows": counts, "seconds": round(time.perf_counter() - start, 2)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from __future__ import with_statement
 
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -38,6 +39,23 @@ def get_metadata():
     return target_db.metadata
 
 
+# search objects created by hand in the migrations (src/search.py), not in the
+# models: the FTS5 virtual tables with their shadow tables on SQLite and the
+# GIN indexes on Postgres
+SEARCH_TABLES = re.compile(r'^\w+_fts(_(data|idx|content|docsize|config))?$')
+SEARCH_INDEXES = re.compile(r'^ix_\w+_(fts|name_trgm)$')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # so autogenerate (flask db migrate / check) does not propose dropping them
+    if reflected and compare_to is None:
+        if type_ == 'table' and SEARCH_TABLES.match(name):
+            return False
+        if type_ == 'index' and SEARCH_INDEXES.match(name):
+            return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -52,7 +70,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -84,6 +103,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
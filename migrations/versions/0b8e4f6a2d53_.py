@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: 0b8e4f6a2d53
+Revises: e7a3c9d04b16
+Create Date: 2026-10-18 15:47:36.218840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b8e4f6a2d53'
+down_revision = 'e7a3c9d04b16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # las filas se construyen en la primera lectura (o con flask rebuild-favoritos)
+    op.create_table('user_favoritos',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('favoritos', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_favoritos')
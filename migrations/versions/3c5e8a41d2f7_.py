@@ -0,0 +1,31 @@
+"""empty message
+
+Revision ID: 3c5e8a41d2f7
+Revises: 776308474c84
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c5e8a41d2f7'
+down_revision = '776308474c84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # batch mode so SQLite can add a column with a non-constant default
+    for table in ('characters', 'planets', 'favoritos'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False))
+            batch_op.create_index(batch_op.f('ix_%s_updated_at' % table), ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('favoritos', 'planets', 'characters'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_%s_updated_at' % table))
+            batch_op.drop_column('updated_at')
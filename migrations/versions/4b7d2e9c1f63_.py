@@ -0,0 +1,104 @@
+"""empty message
+
+Revision ID: 4b7d2e9c1f63
+Revises: 8d4a1f6c3e25
+Create Date: 2026-10-18 21:05:13.402517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7d2e9c1f63'
+down_revision = '8d4a1f6c3e25'
+branch_labels = None
+depends_on = None
+
+# tables with a change counter (src/versions.py)
+VERSIONED = ('characters', 'planets')
+# table -> columns indexed for free text search (5d2b7e9f31a8)
+SEARCH_TEXT = {
+    'characters': ('name',),
+    'planets': ('name', 'climate'),
+}
+
+
+def fts_triggers(table, update_of):
+    # update_of: the row_version stamp must not touch the external content FTS5 index
+    fts = table + '_fts'
+    columns = SEARCH_TEXT[table]
+    fields = ', '.join(columns)
+    new_values = ', '.join('new.' + column for column in columns)
+    old_values = ', '.join('old.' + column for column in columns)
+    for suffix in ('ai', 'ad', 'au'):
+        op.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    op.execute("CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN "
+               "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (fts, table, fts, fields, new_values))
+    op.execute("CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN "
+               "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END" % (fts, table, fts, fts, fields, old_values))
+    op.execute("CREATE TRIGGER %s_au AFTER UPDATE %sON %s BEGIN "
+               "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+               "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END"
+               % (fts, 'OF %s ' % fields if update_of else '', table, fts, fts, fields, old_values, fts, fields, new_values))
+
+
+def drop_triggers(dialect, table):
+    if dialect == 'sqlite':
+        for suffix in ('ai', 'au', 'ad'):
+            op.execute("DROP TRIGGER IF EXISTS %s_version_%s" % (table, suffix))
+    elif dialect == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS %s_version ON %s" % (table, table))
+        op.execute("DROP TRIGGER IF EXISTS %s_row_version ON %s" % (table, table))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table in VERSIONED:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('row_version', sa.BigInteger(), server_default='0', nullable=False))
+            batch_op.create_index(batch_op.f('ix_%s_row_version' % table), ['row_version'], unique=False)
+
+    if dialect == 'postgresql':
+        op.execute("CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS trigger AS $$ BEGIN "
+                   "UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME "
+                   "RETURNING version INTO NEW.row_version; "
+                   "RETURN NEW; END $$ LANGUAGE plpgsql")
+    for table in VERSIONED:
+        drop_triggers(dialect, table)
+        bump = "UPDATE table_versions SET version = version + 1 WHERE name = '%s';" % table
+        stamp = bump + (" UPDATE %s SET row_version = (SELECT version FROM table_versions WHERE name = '%s')"
+                        " WHERE id = new.id;" % (table, table))
+        if dialect == 'sqlite':
+            fts_triggers(table, update_of=True)
+            op.execute("CREATE TRIGGER %s_version_ai AFTER INSERT ON %s BEGIN %s END" % (table, table, stamp))
+            op.execute("CREATE TRIGGER %s_version_au AFTER UPDATE ON %s "
+                       "WHEN new.row_version = old.row_version BEGIN %s END" % (table, table, stamp))
+            op.execute("CREATE TRIGGER %s_version_ad AFTER DELETE ON %s BEGIN %s END" % (table, table, bump))
+        elif dialect == 'postgresql':
+            op.execute("CREATE TRIGGER %s_version AFTER DELETE ON %s "
+                       "FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()" % (table, table))
+            op.execute("CREATE TRIGGER %s_row_version BEFORE INSERT OR UPDATE ON %s "
+                       "FOR EACH ROW EXECUTE PROCEDURE stamp_row_version()" % (table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in VERSIONED:
+        drop_triggers(dialect, table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_%s_row_version' % table))
+            batch_op.drop_column('row_version')
+
+        # on SQLite drop_column copies the table, which loses every trigger on it
+        if dialect == 'sqlite':
+            fts_triggers(table, update_of=False)
+            for suffix, operation in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+                op.execute("CREATE TRIGGER %s_version_%s AFTER %s ON %s BEGIN "
+                           "UPDATE table_versions SET version = version + 1 WHERE name = '%s'; END"
+                           % (table, suffix, operation, table, table))
+        elif dialect == 'postgresql':
+            op.execute("CREATE TRIGGER %s_version AFTER INSERT OR UPDATE OR DELETE ON %s "
+                       "FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()" % (table, table))
+    if dialect == 'postgresql':
+        op.execute("DROP FUNCTION IF EXISTS stamp_row_version()")
@@ -0,0 +1,68 @@
+"""empty message
+
+Revision ID: 5d2b7e9f31a8
+Revises: c81d5f2a9e40
+Create Date: 2026-10-18 13:20:47.618302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from search import postgresql_ddl
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b7e9f31a8'
+down_revision = 'c81d5f2a9e40'
+branch_labels = None
+depends_on = None
+
+# table -> columns indexed for free text search
+SEARCH_TEXT = {
+    'characters': ('name',),
+    'planets': ('name', 'climate'),
+}
+
+
+def upgrade():
+    op.create_index(op.f('ix_characters_gender'), 'characters', ['gender'], unique=False)
+    op.create_index(op.f('ix_characters_height'), 'characters', ['height'], unique=False)
+    op.create_index(op.f('ix_planets_climate'), 'planets', ['climate'], unique=False)
+    op.create_index(op.f('ix_planets_population'), 'planets', ['population'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    for table, columns in SEARCH_TEXT.items():
+        fts = table + '_fts'
+        fields = ', '.join(columns)
+        new_values = ', '.join('new.' + column for column in columns)
+        old_values = ', '.join('old.' + column for column in columns)
+        if dialect == 'sqlite':
+            op.execute("CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id')" % (fts, fields, table))
+            op.execute("CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN "
+                       "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (fts, table, fts, fields, new_values))
+            op.execute("CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN "
+                       "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END" % (fts, table, fts, fts, fields, old_values))
+            op.execute("CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN "
+                       "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+                       "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (fts, table, fts, fts, fields, old_values, fts, fields, new_values))
+            op.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+        elif dialect == 'postgresql':
+            # the same statements db.create_all() runs (src/search.py)
+            for statement in postgresql_ddl(table, columns):
+                op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCH_TEXT:
+        if dialect == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute("DROP TRIGGER IF EXISTS %s_fts_%s" % (table, suffix))
+            op.execute("DROP TABLE IF EXISTS %s_fts" % table)
+        elif dialect == 'postgresql':
+            op.execute("DROP INDEX IF EXISTS ix_%s_name_trgm" % table)
+            op.execute("DROP INDEX IF EXISTS ix_%s_fts" % table)
+
+    op.drop_index(op.f('ix_planets_population'), table_name='planets')
+    op.drop_index(op.f('ix_planets_climate'), table_name='planets')
+    op.drop_index(op.f('ix_characters_height'), table_name='characters')
+    op.drop_index(op.f('ix_characters_gender'), table_name='characters')
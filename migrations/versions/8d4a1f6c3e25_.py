@@ -0,0 +1,57 @@
+"""empty message
+
+Revision ID: 8d4a1f6c3e25
+Revises: f1c6d28b9a47
+Create Date: 2026-10-18 18:12:40.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4a1f6c3e25'
+down_revision = 'f1c6d28b9a47'
+branch_labels = None
+depends_on = None
+
+# tables with a change counter (src/versions.py)
+VERSIONED = ('characters', 'planets')
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN "
+                   "UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME; "
+                   "RETURN NULL; END $$ LANGUAGE plpgsql")
+    for table in VERSIONED:
+        op.execute("INSERT INTO table_versions (name, version) VALUES ('%s', 0)" % table)
+        if dialect == 'sqlite':
+            for suffix, operation in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+                op.execute("CREATE TRIGGER %s_version_%s AFTER %s ON %s BEGIN "
+                           "UPDATE table_versions SET version = version + 1 WHERE name = '%s'; END"
+                           % (table, suffix, operation, table, table))
+        elif dialect == 'postgresql':
+            op.execute("CREATE TRIGGER %s_version AFTER INSERT OR UPDATE OR DELETE ON %s "
+                       "FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()" % (table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in VERSIONED:
+        if dialect == 'sqlite':
+            for suffix in ('ai', 'au', 'ad'):
+                op.execute("DROP TRIGGER IF EXISTS %s_version_%s" % (table, suffix))
+        elif dialect == 'postgresql':
+            op.execute("DROP TRIGGER IF EXISTS %s_version ON %s" % (table, table))
+    if dialect == 'postgresql':
+        op.execute("DROP FUNCTION IF EXISTS bump_table_version()")
+
+    op.drop_table('table_versions')
@@ -0,0 +1,33 @@
+"""empty message
+
+Revision ID: a4f19c07be62
+Revises: 3c5e8a41d2f7
+Create Date: 2026-10-18 11:03:54.771920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f19c07be62'
+down_revision = '3c5e8a41d2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### password hashes do not fit in 80 chars ###
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=80),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=80),
+               existing_nullable=False)
@@ -0,0 +1,39 @@
+"""empty message
+
+Revision ID: c81d5f2a9e40
+Revises: a4f19c07be62
+Create Date: 2026-10-18 11:48:09.215634
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d5f2a9e40'
+down_revision = 'a4f19c07be62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # remove duplicated favorites first, keeping the oldest row
+    op.execute("""
+        DELETE FROM favoritos WHERE characters_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM favoritos WHERE characters_id IS NOT NULL GROUP BY user_id, characters_id)
+    """)
+    op.execute("""
+        DELETE FROM favoritos WHERE characters_id IS NULL AND id NOT IN (
+            SELECT MIN(id) FROM favoritos WHERE characters_id IS NULL GROUP BY user_id, planets_id)
+    """)
+    op.create_index('ix_favoritos_user_id_characters_id', 'favoritos', ['user_id', 'characters_id'], unique=True)
+    op.create_index('ix_favoritos_user_id_planets_id', 'favoritos', ['user_id', 'planets_id'], unique=False)
+    op.create_index('uq_favoritos_user_id_planets_id', 'favoritos', ['user_id', 'planets_id'], unique=True,
+                    sqlite_where=sa.text('characters_id IS NULL'),
+                    postgresql_where=sa.text('characters_id IS NULL'))
+
+
+def downgrade():
+    op.drop_index('uq_favoritos_user_id_planets_id', table_name='favoritos')
+    op.drop_index('ix_favoritos_user_id_planets_id', table_name='favoritos')
+    op.drop_index('ix_favoritos_user_id_characters_id', table_name='favoritos')
@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: e7a3c9d04b16
+Revises: 5d2b7e9f31a8
+Create Date: 2026-10-18 15:02:11.904517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c9d04b16'
+down_revision = '5d2b7e9f31a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_characters_name'), 'characters', ['name'], unique=False)
+    op.create_index(op.f('ix_planets_name'), 'planets', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_planets_name'), table_name='planets')
+    op.drop_index(op.f('ix_characters_name'), table_name='characters')
@@ -1,21 +1,114 @@
 import os
-from flask_admin import Admin
+import threading
+from flask import Flask
+from sqlalchemy.orm import scoped_session, sessionmaker
+from wtforms.fields.core import UnboundField
 from models import db, User, Character, Planet, Favorito
-from flask_admin.contrib.sqla import ModelView
 
-def setup_admin(app):
+
+def dict_flags(form_class):
+    # flask-admin 1.x declara field_flags como tupla (Unique); WTForms 3 espera un
+    # dict ('tuple' object has no attribute 'items'). Se corrige en cada validador
+    # de este formulario, sin tocar las clases de flask-admin
+    for field in vars(form_class).values():
+        if isinstance(field, UnboundField):
+            for validator in field.kwargs.get("validators", ()):
+                flags = getattr(validator, "field_flags", {})
+                if isinstance(flags, tuple):
+                    validator.field_flags = dict.fromkeys(flags, True)
+    return form_class
+
+
+def setup_admin(app, session=None):
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
+    session = session if session is not None else db.session
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    class FavoritoAdmin(ModelView):
+    class AdminView(ModelView):
+
+        def scaffold_form(self):
+            return dict_flags(super().scaffold_form())
+
+        def scaffold_list_form(self, widget=None, validators=None):
+            return dict_flags(super().scaffold_list_form(widget, validators))
+
+    class EntityAdmin(AdminView):
+        # favoritos: backref que WTForms 3 no sabe pintar (y guardarlo vacio
+        # soltaria los favoritos); updated_at y row_version los pone la base, no el formulario
+        form_excluded_columns = ("favoritos", "updated_at", "row_version")
+
+    class FavoritoAdmin(AdminView):
         column_list = ("id", "user_id", "planets_id","characters_id", )
         form_columns = ("user_id", "planets_id","characters_id")
         column_hide_backrefs = False
 
     
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(FavoritoAdmin(Favorito, db.session))
\ No newline at end of file
+    admin.add_view(EntityAdmin(User, session))
+    admin.add_view(EntityAdmin(Character, session))
+    admin.add_view(EntityAdmin(Planet, session))
+    admin.add_view(FavoritoAdmin(Favorito, session))
+
+
+def admin_session(app):
+    """A scoped session on the primary engine of ``app``, usable outside its app context."""
+    # el mismo engine (pool, metricas) que la app principal: db.init_app() en la
+    # app del admin crearia un segundo juego de engines
+    with app.app_context():
+        engine = db.engine
+    factory = db.session.session_factory
+
+    class AdminSession(factory.class_):
+        # Session.get_bind busca el engine por current_app, que aqui es la app del
+        # admin; las escrituras del admin van siempre al primario
+        def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+            return bind if bind is not None else self.bind
+
+    # misma clase base: los listeners de cache, snapshot y favoritos siguen funcionando
+    return scoped_session(sessionmaker(**dict(factory.kw, class_=AdminSession, bind=engine)))
+
+
+class LazyAdmin:
+    """
+    WSGI middleware in front of the API app: the first request under /admin
+    builds a separate Flask app with the admin views (same config and engines) and
+    every /admin request goes to it from then on. flask_admin and wtforms are
+    only imported by then.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._admin_app = None
+        self._lock = threading.Lock()
+
+    def admin_app(self):
+        if self._admin_app is None:
+            with self._lock:
+                if self._admin_app is None:
+                    admin_app = Flask(self.app.import_name)
+                    admin_app.config.update(self.app.config)
+                    session = admin_session(self.app)
+                    admin_app.teardown_appcontext(lambda exc: session.remove())
+                    setup_admin(admin_app, session)
+                    self._admin_app = admin_app
+        return self._admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == "/admin" or path.startswith("/admin/"):
+            return self.admin_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+
+def setup_lazy_admin(app):
+    # ADMIN: lazy (on the first /admin request), on (at startup) or off
+    mode = app.config.get("ADMIN", "lazy")
+    if mode == "on":
+        setup_admin(app)
+    elif mode == "lazy":
+        app.wsgi_app = LazyAdmin(app)
@@ -2,49 +2,309 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import json
+import click
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, url_for, stream_with_context
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
+from utils import APIException, generate_sitemap, keyset_statement, keyset_trim, parse_fields, wants_stream, stream_rows, make_etag, table_version
+from encoding import setup_json, row_encoder, encode_page
+from admin import setup_lazy_admin
+from cache import setup_cache, watch_cache, entity_key, MemoryCache
+from passwords import setup_passwords
+from search import register_search_ddl, search_page
+from versions import register_version_ddl
+from database import setup_database, read_from_replica, use_primary
+from instrumentation import setup_instrumentation
+from compression import setup_compression
+from ratelimit import setup_ratelimit
+from idempotency import setup_idempotency
+from catalog_import import import_catalog_command
+from materialized import setup_materialized_favoritos, load_favoritos
+from writebehind import setup_write_behind
+from snapshot import setup_catalog_snapshot
+from openapi import build_openapi
+from metrics import REGISTRY
 from models import db, User, Character, Planet, Favorito
 from flask_jwt_extended import create_access_token
-from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import current_user
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import JWTManager
 import re
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 #from models import Person
 
-app = Flask(__name__)
+api = Blueprint('api', __name__)
+jwt = JWTManager()
 
-# Setup the Flask-JWT-Extended extension
-app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
-jwt = JWTManager(app)
 
-app.url_map.strict_slashes = False
+def create_app(config=None):
+    """
+    Builds the app. Optional components are picked with ADMIN and MIGRATIONS
+    (environment or ``config``):
 
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    - ADMIN=lazy (default) builds Flask-Admin on the first /admin request,
+      ADMIN=on at startup, ADMIN=off never.
+    - MIGRATIONS=auto (default) registers Flask-Migrate only when the app is
+      loaded by the `flask` command (flask db upgrade), MIGRATIONS=on always,
+      MIGRATIONS=off never.
 
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+    API-only workers then never import flask_admin/wtforms or alembic.
+    """
+    app = Flask(__name__)
+    setup_json(app)
+
+    # Setup the Flask-JWT-Extended extension
+    app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
+    jwt.init_app(app)
+
+    app.url_map.strict_slashes = False
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PAGE_DEFAULT_LIMIT'] = int(os.getenv("PAGE_DEFAULT_LIMIT", 100))
+    app.config['PAGE_MAX_LIMIT'] = int(os.getenv("PAGE_MAX_LIMIT", 1000))
+    app.config['STREAM_BATCH_SIZE'] = int(os.getenv("STREAM_BATCH_SIZE", 500))
+    app.config['ADMIN'] = os.getenv("ADMIN", "lazy").lower()
+    app.config['MIGRATIONS'] = os.getenv("MIGRATIONS", "auto").lower()
+    # flask_cors y asgi.py: "*" o una lista de origenes separada por comas
+    app.config['CORS_ORIGINS'] = os.getenv("CORS_ORIGINS", "*").split(",")
+    app.config.update(config or {})
+
+    if app.config['MIGRATIONS'] == 'on' or \
+            (app.config['MIGRATIONS'] == 'auto' and click.get_current_context(silent=True) is not None):
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    engine = setup_database(app, db)
+    setup_instrumentation(app, engine)
+    setup_compression(app)
+    setup_ratelimit(app)
+    setup_idempotency(app)
+    CORS(app)
+    setup_lazy_admin(app)
+    setup_cache(app, db)
+    setup_catalog_snapshot(app, db)
+    setup_passwords(app)
+    setup_materialized_favoritos(app, db)
+    setup_write_behind(app)
+
+    # The JWT identity is the user id. Resolving it to a user goes through a
+    # short-lived cache, evicted when the user row is committed (PUT /users/<id>, admin)
+    app.extensions['jwt_user_cache'] = watch_cache(app, MemoryCache(
+        max_entries=int(os.getenv("JWT_USER_CACHE_MAX_ENTRIES", 4096)),
+        ttl=int(os.getenv("JWT_USER_CACHE_TTL", 60))))
+
+    app.register_blueprint(api)
+    app.cli.add_command(import_catalog_command)
+    return app
+
+
+register_search_ddl(Character, Planet)
+register_version_ddl(db.metadata, Character, Planet)
+
+@jwt.user_lookup_loader
+def user_lookup_callback(_jwt_header, jwt_data):
+    identity = jwt_data["sub"]
+    if not str(identity).isdigit():
+        return None
+    user_cache = current_app.extensions['jwt_user_cache']
+    key = entity_key(User.__tablename__, identity)
+    user = user_cache.get(key)
+    if user is None:
+        user_query = db.session.get(User, int(identity))
+        if user_query is None:
+            return None
+        user = user_query.serialize()
+        user_cache.set(key, user)
+    return user
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+# pages that only change with the code: built on the first request, then
+# served as the same bytes (and ETag) until the process restarts
+def precomputed_response(key, build, mimetype):
+
+    pages = current_app.extensions.setdefault('precomputed', {})
+    if key not in pages:
+        body = build().encode()
+        pages[key] = (body, make_etag(body))
+    body, etag = pages[key]
+
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    return conditional_response(Response(body, mimetype=mimetype), etag)
+
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return precomputed_response('sitemap', lambda: generate_sitemap(current_app), 'text/html')
+
+@api.route('/openapi.json', methods=['GET'])
+def get_openapi():
+    return precomputed_response('openapi', lambda: json.dumps(build_openapi(current_app), indent=2),
+                                'application/json')
+
+# liveness for the load balancer: no database, no templates
+@api.route('/healthz', methods=['GET'])
+def healthz():
+    return Response('ok\n', mimetype='text/plain')
+
+# readiness: the pool has a free connection and the database answers
+@api.route('/readyz', methods=['GET'])
+def readyz():
+
+    engine = db.engine
+    options = current_app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    capacity = options.get('pool_size', 5) + options.get('max_overflow', 10)
+    checked_out = engine.pool.checkedout() if hasattr(engine.pool, 'checkedout') else 0
+
+    response_body = {"checked_out": checked_out, "capacity": capacity}
+    if checked_out >= capacity:
+        response_body["status"] = "pool exhausted"
+        return jsonify(response_body), 503
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    except Exception as error:
+        response_body["status"] = "database unavailable: %s" % error.__class__.__name__
+        return jsonify(response_body), 503
+
+    response_body["status"] = "ready"
+    return jsonify(response_body), 200
+
+# conditional GET: answer 304 before loading or serializing anything.
+# Only on the ETag: Last-Modified (max updated_at) does not move on deletes
+def is_not_modified(etag):
+
+    # comparacion debil: las respuestas comprimidas llevan W/"etag"
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return False
+
+def conditional_response(response, etag, last_modified=None):
+
+    if isinstance(response, tuple):
+        response = current_app.make_response(response)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def not_modified_response(etag, last_modified=None):
+
+    return conditional_response(Response(status=304), etag, last_modified)
+
+# keyset pagination: ?limit=&after=<cursor>&fields=name,climate
+# full export as NDJSON: ?stream=1 or Accept: application/x-ndjson
+def list_response(model, endpoint):
+
+    # characters y planets salen de la copia en memoria (snapshot.py), sin query
+    table = snapshot_table(model)
+
+    if wants_stream(request):
+        if table is not None:
+            fields = parse_fields(model, request.args.get('fields'))
+            encode = row_encoder(model, fields)
+            rows = (encode(row) + "\n" for row in table.rows(fields))
+        else:
+            rows = stream_rows(db.session, model, request.args, current_app.config['STREAM_BATCH_SIZE'])
+        return Response(stream_with_context(rows), mimetype='application/x-ndjson')
+
+    last_modified, etag = None, None
+    if hasattr(model, 'updated_at'):
+        last_modified, version = table.version if table is not None else table_version(db.session, model)
+        etag = make_etag(model.__tablename__, version, request.full_path)
+        if is_not_modified(etag):
+            return not_modified_response(etag, last_modified)
+
+    if table is not None:
+        rows, fields, limit = table.page(request.args, current_app.config['PAGE_DEFAULT_LIMIT'],
+                                         current_app.config['PAGE_MAX_LIMIT'])
+    else:
+        statement, fields, limit = keyset_statement(model, request.args,
+                                                    current_app.config['PAGE_DEFAULT_LIMIT'],
+                                                    current_app.config['PAGE_MAX_LIMIT'])
+        rows = db.session.execute(statement).all()
+    rows, next_cursor = keyset_trim(rows, limit)
+
+    next_url = None
+    if next_cursor is not None:
+        params = request.args.to_dict()
+        params['after'] = next_cursor
+        next_url = url_for(endpoint, **params)
+
+    if current_app.config['JSON_ROW_ENCODER']:
+        # bytes directamente desde las tuplas, sin un dict por fila
+        response = Response(encode_page(row_encoder(model, fields), rows, next_url), mimetype='application/json')
+    else:
+        response = jsonify({
+           "results": [dict(zip(fields, row)) for row in rows],
+           "next": next_url
+        })
+
+    if etag is not None:
+        return conditional_response(response, etag, last_modified), 200
+    return response, 200
+
+def snapshot_table(model):
+
+    snapshot = current_app.extensions.get('catalog_snapshot')
+    return snapshot.table(model) if snapshot is not None else None
+
+# ?q= full text (ranked) plus structured filters, see search.py
+def search_response(model, endpoint, args):
+
+    results, next_cursor = search_page(db.session, model, args,
+                                       current_app.config['PAGE_DEFAULT_LIMIT'],
+                                       current_app.config['PAGE_MAX_LIMIT'])
+
+    next_url = None
+    if next_cursor is not None:
+        params = args.to_dict() if hasattr(args, 'to_dict') else dict(args)
+        params['after'] = next_cursor
+        next_url = url_for(endpoint, **params)
+
+    return {
+       "results": results,
+       "next": next_url
+    }
+
+# detail responses are cached as ready-to-send JSON bytes
+def cached_detail_response(model, entity_id, not_found_msg):
+
+    # el snapshot primero: si toca refrescarlo, echa de la cache los detalles que cambiaron
+    table = snapshot_table(model)
+    key = entity_key(model.__tablename__, entity_id)
+    cache = current_app.extensions['cache']
+    body = cache.get(key)
+
+    if body is None:
+        if table is not None:
+            result = table.get(entity_id)
+        else:
+            # lo que se guarda en la cache sale del primario: una replica atrasada
+            # dejaria en ella la version de antes de la ultima escritura
+            with use_primary():
+                entity = db.session.get(model, entity_id)
+                result = entity.serialize() if entity is not None else None
+        if result is None:
+            return jsonify({"msg": not_found_msg}), 404
+        body = current_app.json.dumps({"results": result}).encode()
+        cache.set(key, body)
+
+    etag = make_etag(body)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+
+    return conditional_response(Response(body, status=200, mimetype='application/json'), etag)
 
 # --- ENDPOINTS ---
 
@@ -52,109 +312,220 @@ def sitemap():
 
 # CHARACTERS
 
-@app.route('/characters', methods=['GET'])
+@api.route('/characters', methods=['GET'])
+@read_from_replica
 def get_all_characters():
 
-    characters_query = Character.query.all()
-    results = list(map(lambda item: item.serialize(), characters_query))
-
-    response_body = {
-       "results": results
-    }
-
-    return jsonify(response_body), 200
+    return list_response(Character, '.get_all_characters')
 
 
-@app.route('/characters/<int:character_id>', methods=['GET'])
+@api.route('/characters/<int:character_id>', methods=['GET'])
+@read_from_replica
 def get_one_characters(character_id):
 
-    character_query = Character.query.filter_by(id=character_id).first()
-    
-    if character_query is None:
-        return jsonify({"msg": "Character not exist"}), 404
+    return cached_detail_response(Character, character_id, "Character not exist")
 
-    response_body = {
-       "results": character_query.serialize()
-    }
+@api.route('/characters/search', methods=['GET'])
+@read_from_replica
+def search_characters():
 
-    return jsonify(response_body), 200
+    return jsonify(search_response(Character, '.search_characters', request.args)), 200
 
 # PLANETS
 
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['GET'])
+@read_from_replica
 def get_all_planets():
 
-    planets_query = Planet.query.all()
-    results = list(map(lambda item: item.serialize(), planets_query))
+    return list_response(Planet, '.get_all_planets')
 
-    response_body = {
-       "results": results
-    }
 
-    return jsonify(response_body), 200
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@read_from_replica
+def get_one_planets(planet_id):
 
+    return cached_detail_response(Planet, planet_id, "Planet not exist")
 
-@app.route('/planets/<int:planet_id>', methods=['GET'])
-def get_one_planets(planet_id):
+@api.route('/planets/search', methods=['GET'])
+@read_from_replica
+def search_planets():
 
-    planet_query = Planet.query.filter_by(id=planet_id).first()
+    return jsonify(search_response(Planet, '.search_planets', request.args)), 200
 
-    if planet_query is None:
-        return jsonify({"msg": "Planet not exist"}), 404
+# SEARCH (characters and planets at once, only ?q= and ?limit=)
+
+@api.route('/search', methods=['GET'])
+@read_from_replica
+def search_all():
+
+    args = dict((key, value) for key, value in request.args.items() if key in ('q', 'limit'))
 
     response_body = {
-       "results": planet_query.serialize()
+       "characters": search_response(Character, '.search_characters', args),
+       "planets": search_response(Planet, '.search_planets', args)
     }
 
     return jsonify(response_body), 200
 
 # USERS
 
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@read_from_replica
 def get_all_users():
 
-    users_query = User.query.all()
-    results = list(map(lambda item: item.serialize(), users_query))
+    return list_response(User, '.get_all_users')
+
+
+@api.route('/users/<int:user_id>/favoritos', methods=['GET'])
+@read_from_replica
+def get_favoritos(user_id):
+
+    if flush_favoritos(user_id):
+        # lo recien escrito aun no ha llegado a las replicas
+        g.pop('db_route', None)
+
+    # una lectura por clave primaria de la vista materializada (materialized.py)
+    document = load_favoritos(db.session, user_id)
+    etag = make_etag(request.full_path, document)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+
+    # TODOS LOS FAVORITOS (?all=true), el JSON guardado tal cual
+
+    if request.args.get('all', '').lower() in ('1', 'true', 'yes'):
+        response = Response('{"results":%s}' % document, mimetype='application/json')
+        return conditional_response(response, etag), 200
+
+    # UN FAVORITO
+
+    favoritos = json.loads(document)
+
+    if not favoritos:
+        return jsonify({"msg": "Favorito not exist"}), 404
 
     response_body = {
-       "results": results
+       "results": favoritos[0]
     }
 
-    return jsonify(response_body), 200
+    return conditional_response(jsonify(response_body), etag), 200
 
 
-@app.route('/users/<int:user_id>/favoritos', methods=['GET'])
-def get_favoritos(user_id):
+# METRICS (Prometheus text format)
 
-    # UN FAVORITO
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+
+    return Response(REGISTRY.render(), status=200, mimetype='text/plain; version=0.0.4')
+
+# CACHE
 
-    favorito_query = Favorito.query.filter_by(user_id=user_id).first()
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
 
     response_body = {
-       "results": favorito_query.serialize()
+        "catalog": current_app.extensions['cache'].stats(),
+        "jwt_users": current_app.extensions['jwt_user_cache'].stats()
     }
+    if 'catalog_snapshot' in current_app.extensions:
+        response_body["catalog_snapshot"] = current_app.extensions['catalog_snapshot'].stats()
 
     return jsonify(response_body), 200
 
 
 # ----------------------- POST -----------------------
-# FAVORITOS 
+# FAVORITOS (FAVORITOS_WRITE_BEHIND=1: se encolan y se escriben por lotes, writebehind.py)
 
-@app.route('/users/<int:user_id>/favoritos/', methods=['POST'])
+def flush_favoritos(user_id):
+
+    write_behind = current_app.extensions.get('favoritos_write_behind')
+    return write_behind is not None and write_behind.wait_for_user(user_id)
+
+
+def queue_favorito(user_id, body, present):
+
+    outcome = current_app.extensions['favoritos_write_behind'].change(
+        user_id, body.get('characters_id'), body.get('planets_id'), present)
+    if outcome == 'user_not_found':
+        return jsonify({"msg": "User not exist"}), 404
+    if outcome == 'invalid':
+        return jsonify({"msg": "Character or Planet not exist"}), 400
+    if outcome == 'exists':
+        return jsonify({"msg": "Favorito already exists"}), 409
+    if outcome == 'not_found':
+        return jsonify({"msg": "Favorito not exist"}), 404
+
+    response_body = {
+        'msg':'ok',
+        "results": ['Favorito Queued' if present else 'Favorito deletion Queued',
+                    {"characters_id": body.get('characters_id'), "planets_id": body.get('planets_id'), "user_id": user_id}]
+    }
+
+    return jsonify(response_body), 202
+
+
+@api.route('/users/<int:user_id>/favoritos/', methods=['POST'])
 def add_favorito(user_id):
 
     request_body = request.get_json(force=True)
 
+    if 'favoritos_write_behind' in current_app.extensions:
+        return queue_favorito(user_id, request_body, True)
+
     favorito = Favorito(characters_id= request_body['characters_id'],
                         planets_id= request_body['planets_id'],
                         user_id= user_id)
     
     db.session.add(favorito)
-    db.session.commit()
+    try:
+        # con el id ya asignado y antes de que commit() expire el objeto:
+        # serialize() no tiene que volver a leerlo
+        db.session.flush()
+        result = favorito.serialize()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"msg": "Favorito already exists"}), 409
 
     response_body = {
         'msg':'ok',
-        "results": ['Favorito Created', favorito.serialize()]
+        "results": ['Favorito Created', result]
+    }
+
+    return jsonify(response_body), 200
+
+
+# FAVORITOS (BATCH): [{"characters_id": 1, "planets_id": null}, ...]
+
+def batch_items():
+
+    request_body = request.get_json(force=True)
+    if isinstance(request_body, dict):
+        request_body = request_body.get('favoritos')
+    if not isinstance(request_body, list) or not all(isinstance(item, dict) for item in request_body):
+        raise APIException('expected a list of {characters_id, planets_id}', status_code=400)
+    return request_body
+
+
+@api.route('/users/<int:user_id>/favoritos/batch', methods=['POST'])
+def add_favoritos_batch(user_id):
+
+    items = batch_items()
+    flush_favoritos(user_id)
+
+    if db.session.get(User, user_id) is None:
+        return jsonify({"msg": "User not exist"}), 404
+
+    try:
+        outcomes = Favorito.bulk_add(user_id, items)
+        db.session.commit()
+    except IntegrityError:
+        # otra peticion del mismo usuario inserto alguno entre la lectura y el INSERT
+        db.session.rollback()
+        return jsonify({"msg": "Favorito already exists"}), 409
+
+    response_body = {
+        'msg':'ok',
+        "results": outcomes
     }
 
     return jsonify(response_body), 200
@@ -162,7 +533,7 @@ def add_favorito(user_id):
 
 # USERS
 
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 def create_user():
 
     request_body = request.get_json(force=True)
@@ -202,6 +573,8 @@ def create_user():
             'msg':'wrong email format(check @ .)'
         }), 400
 
+    user.password = current_app.extensions['passwords'].hash(request_body['password'])
+
     db.session.add(user)
     db.session.commit()
 
@@ -213,10 +586,13 @@ def create_user():
 
 # ----------------------- DELETE -----------------------
 
-@app.route('/users/<int:user_id>/favoritos/', methods=['DELETE'])
+@api.route('/users/<int:user_id>/favoritos/', methods=['DELETE'])
 def del_favorito(user_id ):
 
     body = request.get_json(force=True)
+
+    if 'favoritos_write_behind' in current_app.extensions:
+        return queue_favorito(user_id, body, False)
     
     if body["characters_id"] is None:
         favorito_query= Favorito.query.filter_by(user_id=user_id).filter_by(planets_id=body["planets_id"]).first()
@@ -235,9 +611,26 @@ def del_favorito(user_id ):
 
     return jsonify(response_body), 200
 
+
+@api.route('/users/<int:user_id>/favoritos/batch', methods=['DELETE'])
+def del_favoritos_batch(user_id):
+
+    items = batch_items()
+    flush_favoritos(user_id)
+
+    outcomes = Favorito.bulk_delete(user_id, items)
+    db.session.commit()
+
+    response_body = {
+        'msg':'ok',
+        "results": outcomes
+    }
+
+    return jsonify(response_body), 200
+
 # ----------------------- PUT -----------------------
 
-@app.route('/users/<int:user_id>', methods=['PUT', 'GET'])
+@api.route('/users/<int:user_id>', methods=['PUT', 'GET'])
 def get_single_user(user_id):
 
     body = request.get_json(force=True) #{ 'username': 'new_username'}
@@ -255,7 +648,7 @@ def get_single_user(user_id):
 
 # Create a route to authenticate your users and return JWTs. The
 # create_access_token() function is used to actually generate the JWT.
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     email = request.json.get("email", None)
     password = request.json.get("password", None)
@@ -265,26 +658,31 @@ def login():
     if user is None:
         return jsonify({"msg": "email do not exist"}), 404
 
-    if password != user.password:
+    valid, new_hash = current_app.extensions['passwords'].verify(password, user.password)
+
+    if not valid:
         return jsonify({"msg": "Bad password"}), 401
 
-    access_token = create_access_token(identity=email)
+    # coste nuevo o contraseña antigua en texto plano: la guardamos hasheada
+    if new_hash is not None:
+        user.password = new_hash
+        db.session.commit()
+
+    access_token = create_access_token(identity=str(user.id))
     return jsonify(access_token=access_token)
 
 # Protect a route with jwt_required, which will kick out requests
 # without a valid JWT present.
-@app.route("/profile", methods=["GET"])
+@api.route("/profile", methods=["GET"])
 @jwt_required()
 def get_profile():
-    # Access the identity of the current user with get_jwt_identity
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(email=current_user).first()
-    if user is None:
-        return jsonify({"msg": "user do not exist"}), 404
-    return jsonify(logged_in_as=current_user), 200
+    # current_user comes from user_lookup_callback (cached, no query on a hit)
+    return jsonify(logged_in_as=current_user["email"]), 200
 
 # --- FIN ENDPOINTS ---
 
+app = create_app()
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,291 @@
+"""
+ASGI entry point, an alternative to wsgi.py:
+
+    $ uvicorn asgi:application --app-dir src/ --workers 2
+
+The read endpoints (/characters, /planets and /users/<id>/favoritos) are served
+by async handlers on an async SQLAlchemy engine, so a worker keeps serving
+other requests while it waits on the database. Every other route, and the
+streaming exports, go to the regular Flask app through WsgiToAsgi.
+
+The async routes apply what the Flask hooks apply to the rest: a slot out
+of MAX_CONCURRENT_REQUESTS (503 when none is left), the request metrics and
+Server-Timing, response compression and the CORS_ORIGINS headers. Like the
+Flask views, the lists come from the catalog snapshot when it is on, and the
+queries go to a read replica (DATABASE_REPLICA_URLS) unless the client just
+wrote or every replica lags. The rate limit rules only cover
+/login and the writes, which all go to Flask.
+
+Needs an async driver for the configured database: asyncpg for Postgres,
+aiosqlite for the SQLite fallback.
+"""
+import asyncio
+import contextvars
+import json
+import re
+import time
+from urllib.parse import parse_qsl, urlencode
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import event, select
+from flask_cors.core import get_cors_headers, get_cors_options
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import Accept, Headers
+from werkzeug.http import parse_accept_header, parse_cookie
+from app import app
+from database import PIN_COOKIE, ROUTED, replica_urls
+from instrumentation import record, server_timing
+from materialized import dump
+from models import Character, Planet, Favorito, UserFavoritos
+from ratelimit import SHED
+from utils import APIException, keyset_statement, keyset_results, make_etag, version_statement
+
+ASYNC_DRIVERS = (
+    ("postgresql://", "postgresql+asyncpg://"),
+    ("sqlite://", "sqlite+aiosqlite://"),
+)
+
+FAVORITOS_PATH = re.compile(r"^/users/(\d+)/favoritos/?$")
+
+# [queries, seconds] de la peticion en curso; cada tarea de asyncio tiene el suyo
+SQL_STATS = contextvars.ContextVar("sql_stats", default=None)
+
+
+def async_database_uri(uri):
+    for prefix, async_prefix in ASYNC_DRIVERS:
+        if uri.startswith(prefix):
+            return async_prefix + uri[len(prefix):]
+    return uri
+
+
+def create_engine_for(flask_app, uri=None):
+    options = dict(flask_app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+    # el pool sincrono con metricas no sirve para el engine async
+    options.pop("poolclass", None)
+    return create_async_engine(async_database_uri(uri or flask_app.config["SQLALCHEMY_DATABASE_URI"]), **options)
+
+
+class AsyncReadApp:
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.fallback = WsgiToAsgi(flask_app)
+        self.engine = create_engine_for(flask_app)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+        # un engine async por replica, en el orden de replica_set.replicas
+        self.replica_set = flask_app.extensions.get("replicas")
+        self.replica_engines = [create_engine_for(flask_app, url)
+                                for url in replica_urls(flask_app.config["DATABASE_REPLICA_URLS"])]
+        self.replica_sessions = [async_sessionmaker(engine, expire_on_commit=False) for engine in self.replica_engines]
+        self.snapshot = flask_app.extensions.get("catalog_snapshot")
+        # mismos nombres de endpoint que en Flask: las metricas no cambian con el servidor
+        self.routes = {
+            "/characters": (Character, "api.get_all_characters"),
+            "/planets": (Planet, "api.get_all_planets"),
+        }
+        self.slots = flask_app.extensions.get("request_slots")
+        self.compressor = flask_app.extensions.get("compression")
+        self.cors = get_cors_options(flask_app)
+        for engine in [self.engine] + self.replica_engines:
+            self.instrument(engine.sync_engine)
+
+    def instrument(self, engine):
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_start"].pop()
+            stats = SQL_STATS.get()
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.fallback(scope, receive, send)
+
+        path = scope["path"].rstrip("/") or "/"
+        args = dict(parse_qsl(scope["query_string"].decode()))
+        headers = dict((name.decode().lower(), value.decode()) for name, value in scope["headers"])
+        # los exports en streaming siguen en Flask
+        if args.get("stream", "").lower() in ("1", "true", "yes") or "application/x-ndjson" in headers.get("accept", ""):
+            return await self.fallback(scope, receive, send)
+
+        request = {"path": path, "args": args, "headers": headers, "method": scope["method"],
+                   "full_path": scope["path"] + "?" + scope["query_string"].decode()}
+        if path in self.routes:
+            model, endpoint = self.routes[path]
+            handler = lambda: self.list_response(model, request)
+        elif FAVORITOS_PATH.match(path):
+            user_id = int(FAVORITOS_PATH.match(path).group(1))
+            endpoint = "api.get_favoritos"
+            handler = lambda: self.favoritos_response(user_id, request)
+        else:
+            return await self.fallback(scope, receive, send)
+
+        await self.serve(send, request, endpoint, handler)
+
+    async def serve(self, send, request, endpoint, handler):
+        start = time.perf_counter()
+        stats = [0, 0.0]
+        SQL_STATS.set(stats)
+        # como shed_and_limit: sin hueco libre se responde ya, sin pedir conexion
+        if self.slots is not None and not self.slots.acquire():
+            SHED.inc()
+            status, body, extra = 503, {"msg": "server busy, try again later"}, {"retry-after": "1"}
+        else:
+            try:
+                status, body, extra = await handler()
+            except APIException as error:
+                status, body, extra = error.status_code, error.to_dict(), {}
+            finally:
+                if self.slots is not None:
+                    self.slots.release()
+
+        payload = b"" if body is None else (self.flask_app.json.dumps(body) + "\n").encode()
+        if status == 200 and body is not None and self.compressor is not None:
+            payload, extra = self.compress(request, payload, extra)
+        extra = self.cors_headers(request, extra)
+        elapsed = time.perf_counter() - start
+        if self.flask_app.config["SERVER_TIMING"]:
+            extra["server-timing"] = server_timing(elapsed, stats[1], stats[0])
+        await self.respond(send, status, payload, body is not None, extra, request["method"] == "HEAD")
+        record(endpoint, request["method"], status, elapsed, stats[0], stats[1], len(payload))
+
+    def compress(self, request, payload, extra):
+        """Like compress_response in compression.py."""
+        extra = dict(extra, vary="Accept-Encoding")
+        accept_encoding = parse_accept_header(request["headers"].get("accept-encoding"), Accept)
+        encoding = self.compressor.encoding(accept_encoding, len(payload))
+        if encoding is None:
+            return payload, extra
+        etag = extra["etag"].strip('"') if "etag" in extra else None
+        payload = self.compressor.compress(payload, etag, encoding)
+        extra["content-encoding"] = encoding
+        if etag is not None:
+            # distinto contenido segun la codificacion: la ETag pasa a ser debil
+            extra["etag"] = 'W/"%s"' % etag
+        return payload, extra
+
+    def cors_headers(self, request, extra):
+        """The headers flask_cors adds on the Flask routes, from the same CORS_* config."""
+        extra = dict(extra)
+        for name, value in get_cors_headers(self.cors, Headers(request["headers"]), request["method"]).items(multi=True):
+            name = name.lower()
+            # Vary puede traer ya Accept-Encoding
+            extra[name] = "%s, %s" % (extra[name], value) if name in extra else str(value)
+        return extra
+
+    async def read_session(self, request, primary=False):
+        """Like current_replica(): a replica's sessionmaker unless there is none, the client just wrote or all lag."""
+        if self.replica_set is None or primary:
+            return self.session
+        pinned = parse_cookie(request["headers"].get("cookie", "")).get(PIN_COOKIE, "")
+        if pinned.isdigit() and int(pinned) > time.time():
+            replica = None
+        elif self.replica_set.due():
+            # medir el retraso son queries sincronas: fuera del bucle de eventos
+            replica = await asyncio.to_thread(self.replica_set.choose)
+        else:
+            replica = self.replica_set.choose()
+        ROUTED.inc(target="primary" if replica is None else "replica")
+        if replica is None:
+            return self.session
+        return self.replica_sessions[self.replica_set.replicas.index(replica)]
+
+    async def snapshot_table(self, model):
+        if self.snapshot is None:
+            return None
+        if self.snapshot.due():
+            # la recarga va a la base con el engine sincrono (db.engine pide app context)
+            return await asyncio.to_thread(self.refreshed_table, model)
+        return self.snapshot.tables.get(model)
+
+    def refreshed_table(self, model):
+        with self.flask_app.app_context():
+            return self.snapshot.table(model)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for engine in [self.engine] + self.replica_engines:
+                    await engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def respond(self, send, status, payload, has_body, extra, head_only=False):
+        headers = [(b"content-type", b"application/json")] if has_body else []
+        headers.append((b"content-length", str(len(payload)).encode()))
+        headers.extend((name.encode(), value.encode()) for name, value in extra.items())
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if head_only else payload})
+
+    def not_modified(self, request, etag):
+        if_none_match = request["headers"].get("if-none-match", "")
+        return if_none_match == "*" or '"%s"' % etag in [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+
+    async def list_response(self, model, request):
+        config = self.flask_app.config
+        table = await self.snapshot_table(model)
+        if table is not None:
+            # como list_response en app.py: la copia en memoria, sin query
+            last_modified, version = table.version
+            etag = make_etag(model.__tablename__, version, request["full_path"])
+            if self.not_modified(request, etag):
+                return 304, None, {"etag": '"%s"' % etag}
+            rows, fields, limit = table.page(request["args"], config["PAGE_DEFAULT_LIMIT"], config["PAGE_MAX_LIMIT"])
+        else:
+            async with (await self.read_session(request))() as session:
+                last_modified, version = (await session.execute(version_statement(model))).one()
+                etag = make_etag(model.__tablename__, version, request["full_path"])
+                if self.not_modified(request, etag):
+                    return 304, None, {"etag": '"%s"' % etag}
+
+                statement, fields, limit = keyset_statement(model, request["args"],
+                                                            config["PAGE_DEFAULT_LIMIT"], config["PAGE_MAX_LIMIT"])
+                rows = (await session.execute(statement)).all()
+        results, next_cursor = keyset_results(rows, fields, limit)
+
+        next_url = None
+        if next_cursor is not None:
+            params = dict(request["args"], after=next_cursor)
+            next_url = request["path"] + "?" + urlencode(params)
+
+        return 200, {"results": results, "next": next_url}, {"etag": '"%s"' % etag}
+
+    async def favoritos_response(self, user_id, request):
+        write_behind = self.flask_app.extensions.get("favoritos_write_behind")
+        # como get_favoritos: antes de leer se escribe lo que el usuario tenga en la cola
+        # (la comprobacion sin lock solo evita el salto de hilo cuando esta vacia)
+        flushed = False
+        if write_behind is not None and (write_behind.pending or write_behind.in_flight):
+            flushed = await asyncio.to_thread(write_behind.wait_for_user, user_id)
+
+        # lo recien escrito aun no ha llegado a las replicas
+        async with (await self.read_session(request, primary=flushed))() as session:
+            document = (await session.execute(select(UserFavoritos.favoritos)
+                                              .where(UserFavoritos.user_id == user_id))).scalar()
+            if document is None:
+                # sin fila materializada todavia: la misma query que la construye
+                document = dump((await session.execute(Favorito.by_user_statement(user_id))).all())
+
+        etag = make_etag(request["full_path"], document)
+        if self.not_modified(request, etag):
+            return 304, None, {"etag": '"%s"' % etag}
+
+        favoritos = json.loads(document)
+        if request["args"].get("all", "").lower() in ("1", "true", "yes"):
+            return 200, {"results": favoritos}, {"etag": '"%s"' % etag}
+        if not favoritos:
+            return 404, {"msg": "Favorito not exist"}, {}
+        return 200, {"results": favoritos[0]}, {"etag": '"%s"' % etag}
+
+
+application = AsyncReadApp(app)
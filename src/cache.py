@@ -0,0 +1,155 @@
+"""
+Read-through caches keyed by table row (see entity_key).
+
+The catalog cache (characters, planets) holds the final JSON body as bytes,
+so a hit skips the query, the serialize() call and the encoder. Entries of
+every watched cache are evicted when a commit touches the row, whether it
+comes from the API or from Flask-Admin.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+
+
+def entity_key(tablename, entity_id):
+    return "%s:%s" % (tablename, entity_id)
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+class MemoryCache:
+    """In-process LRU cache with a TTL per entry."""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate(self.hits, self.misses)
+        }
+
+
+class RedisCache:
+    """Shared cache for several workers, needs the `redis` package."""
+
+    def __init__(self, url, ttl=300, prefix="swapi:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate(self.hits, self.misses)
+        }
+
+
+def create_cache(config):
+    ttl = int(config.get("CACHE_TTL", 300))
+    url = config.get("CACHE_URL")
+    if url:
+        return RedisCache(url, ttl=ttl)
+    return MemoryCache(max_entries=int(config.get("CACHE_MAX_ENTRIES", 1024)), ttl=ttl)
+
+
+def watch_cache(app, cache):
+    """Evict ``cache`` entries keyed with entity_key() when their row is committed."""
+    app.extensions["watched_caches"].append(cache)
+    return cache
+
+
+def setup_cache(app, db):
+    app.config.setdefault("CACHE_URL", os.getenv("CACHE_URL"))
+    app.config.setdefault("CACHE_TTL", int(os.getenv("CACHE_TTL", 300)))
+    app.config.setdefault("CACHE_MAX_ENTRIES", int(os.getenv("CACHE_MAX_ENTRIES", 1024)))
+    cache = create_cache(app.config)
+    app.extensions["cache"] = cache
+    watched = app.extensions["watched_caches"] = [cache]
+    # una clave por app: con varias create_app() en el proceso (tests) cada una vacia sus caches
+    changed_key = ("cache_changed", id(app))
+
+    # after_commit no sabe que filas cambiaron, las apuntamos en cada flush
+    @event.listens_for(db.session, "after_flush")
+    def collect_changed(session, flush_context):
+        changed = session.info.setdefault(changed_key, set())
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            identity = inspect(instance).identity
+            if identity is not None:
+                changed.add(entity_key(instance.__tablename__, identity[0]))
+
+    @event.listens_for(db.session, "after_commit")
+    def evict_changed(session):
+        for key in session.info.pop(changed_key, ()):
+            for watched_cache in watched:
+                watched_cache.delete(key)
+
+    @event.listens_for(db.session, "after_rollback")
+    def forget_changed(session):
+        session.info.pop(changed_key, None)
+
+    return cache
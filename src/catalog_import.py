@@ -0,0 +1,230 @@
+"""
+`flask import-catalog`: bulk load characters or planets from a file.
+
+    $ flask import-catalog characters people.jsonl --batch-size 5000
+    $ flask import-catalog planets planets.csv
+
+Reads JSON lines (.jsonl/.ndjson) or CSV with a header row, one row at a
+time: read -> validate -> batch -> write, all generators, so memory depends
+on --batch-size and not on the file size. Rows are matched by name: names
+already in the table are updated, new ones are inserted (executemany, or COPY
+on Postgres) and identical rows are skipped, so importing the same file twice
+changes nothing. Only the columns in the file are written: a column missing
+from the CSV header (or a key missing from a JSON line) keeps its stored
+value on updated rows and is null on new ones. Unknown keys (and "id") are
+ignored; "", "unknown" and "n/a" in numeric columns become null. Each batch
+is committed on its own.
+"""
+import csv
+import io
+import json
+import sys
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam
+from cache import entity_key
+from models import db, Character, Planet
+
+MODELS = {"characters": Character, "planets": Planet}
+NULL_VALUES = ("", "unknown", "n/a", "none", "null")
+MAX_REPORTED_ERRORS = 20
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    """Yields (line number, dict) from a JSON lines or CSV text stream."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_num, InvalidRow("invalid JSON: %s" % error)
+            continue
+        yield line_num, row if isinstance(row, dict) else InvalidRow("expected a JSON object")
+
+
+def import_columns(model):
+    return [model.__table__.c[field] for field in model.serialize_fields if field != "id"]
+
+
+def clean_value(column, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if column.type.python_type is int and value.lower() in NULL_VALUES:
+            return None
+    if value is None or value == "":
+        return None
+    if column.type.python_type is int:
+        try:
+            return int(str(value).replace(",", ""))
+        except ValueError:
+            raise InvalidRow("%s must be an integer, got %r" % (column.name, value))
+    value = str(value)
+    if column.type.length is not None and len(value) > column.type.length:
+        raise InvalidRow("%s longer than %d characters" % (column.name, column.type.length))
+    return value
+
+
+def validate_rows(model, rows, rejected):
+    """
+    Yields clean rows for ``model``, with only the columns present in the
+    input. Rejected rows are counted in
+    rejected["count"]; the first MAX_REPORTED_ERRORS go to rejected["errors"]
+    as (line, message).
+    """
+    columns = import_columns(model)
+    for line_num, row in rows:
+        try:
+            if isinstance(row, InvalidRow):
+                raise row
+            clean = dict((column.name, clean_value(column, row[column.name]))
+                         for column in columns if column.name in row)
+            if clean.get("name") is None:
+                raise InvalidRow("name is required")
+        except InvalidRow as error:
+            rejected["count"] += 1
+            if len(rejected["errors"]) < MAX_REPORTED_ERRORS:
+                rejected["errors"].append((line_num, str(error)))
+            continue
+        yield clean
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(session, model, rows):
+    """Inserts with COPY FROM STDIN (psycopg2), much faster than INSERT on Postgres."""
+    columns = [column.name for column in import_columns(model)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\N" if row[name] is None else row[name] for name in columns])
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+                       % (model.__tablename__, ", ".join(columns)), buffer)
+
+
+def upsert_batch(session, model, batch, use_copy):
+    """
+    Writes one batch matched by name. Returns (inserted, updated ids,
+    unchanged): rows identical to the stored ones are not rewritten, so a
+    re-import does not bump updated_at (nor the ETags). Only the columns
+    present in a row are compared and updated. Within a batch the last value
+    of each column for a given name wins.
+    """
+    columns = import_columns(model)
+    by_name = {}
+    for row in batch:
+        by_name.setdefault(row["name"], {}).update(row)
+    stored = dict((row.name, row) for row in session.execute(
+        db.select(model.id, *columns).where(model.name.in_(by_name))))
+
+    inserts, updates, unchanged = [], [], 0
+    for name, row in by_name.items():
+        current = stored.get(name)
+        if current is None:
+            inserts.append(dict(dict.fromkeys(column.name for column in columns), **row))
+        elif any(getattr(current, key) != value for key, value in row.items()):
+            updates.append(dict(row, _id=current.id))
+        else:
+            unchanged += 1
+
+    # un UPDATE por juego de columnas: executemany necesita las mismas en cada fila
+    statements = {}
+    for row in updates:
+        statements.setdefault(tuple(column.name for column in columns if column.name in row), []).append(row)
+    for names, rows in statements.items():
+        values = dict((name, bindparam(name)) for name in names)
+        statement = db.update(model).where(model.id == bindparam("_id")).values(**values)
+        session.connection().execute(statement, rows)
+    if inserts:
+        if use_copy:
+            copy_rows(session, model, inserts)
+        else:
+            session.execute(db.insert(model), inserts)
+    return len(inserts), [row["_id"] for row in updates], unchanged
+
+
+def import_catalog(model, stream, fmt, batch_size=5000, progress=None):
+    """Imports every row of ``stream`` into ``model``. Returns a summary dict."""
+    session = db.session
+    dialect = session.get_bind().dialect
+    use_copy = dialect.name == "postgresql" and dialect.driver == "psycopg2"
+    watched = current_app.extensions.get("watched_caches", [])
+    snapshot = current_app.extensions.get("catalog_snapshot")
+
+    rejected = {"count": 0, "errors": []}
+    summary = {"table": model.__tablename__, "inserted": 0, "updated": 0, "unchanged": 0}
+    start = time.perf_counter()
+    for batch in batched(validate_rows(model, read_rows(stream, fmt), rejected), batch_size):
+        inserted, updated_ids, unchanged = upsert_batch(session, model, batch, use_copy)
+        session.commit()
+        # los UPDATE masivos no pasan por el flush: invalidamos a mano el detalle cacheado
+        for entity_id in updated_ids:
+            for cache in watched:
+                cache.delete(entity_key(model.__tablename__, entity_id))
+        if snapshot is not None and (inserted or updated_ids):
+            snapshot.mark_stale()
+        summary["inserted"] += inserted
+        summary["updated"] += len(updated_ids)
+        summary["unchanged"] += unchanged
+        rows = summary["inserted"] + summary["updated"] + summary["unchanged"]
+        if progress is not None:
+            progress(rows, time.perf_counter() - start)
+
+    elapsed = time.perf_counter() - start
+    rows = summary["inserted"] + summary["updated"] + summary["unchanged"]
+    summary["invalid"] = rejected["count"]
+    summary["seconds"] = round(elapsed, 2)
+    summary["rows_per_sec"] = round(rows / elapsed) if elapsed else None
+    summary["errors"] = rejected["errors"]
+    return summary
+
+
+def detect_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+@click.command("import-catalog")
+@click.argument("table", type=click.Choice(sorted(MODELS)))
+@click.argument("stream", metavar="PATH", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["auto", "jsonl", "csv"]), default="auto",
+              help="file format; auto picks csv for *.csv and JSON lines otherwise")
+@click.option("--batch-size", type=click.IntRange(min=1), default=5000, show_default=True)
+@with_appcontext
+def import_catalog_command(table, stream, fmt, batch_size):
+    """Upsert characters or planets by name from a JSON lines or CSV file."""
+    if fmt == "auto":
+        fmt = detect_format(stream.name)
+
+    def progress(rows, elapsed):
+        click.echo("%s: %d rows, %d rows/s" % (table, rows, rows / elapsed if elapsed else 0), err=True)
+
+    summary = import_catalog(MODELS[table], stream, fmt, batch_size, progress)
+
+    for line_num, message in summary["errors"]:
+        click.echo("line %d: %s" % (line_num, message), err=True)
+    click.echo(json.dumps(summary, indent=2))
+    if summary["invalid"]:
+        sys.exit(1)
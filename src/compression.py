@@ -0,0 +1,105 @@
+"""
+Response compression negotiated with Accept-Encoding.
+
+gzip always works; br and zstd are used when the optional `brotli` and
+`zstandard` packages are installed. Bodies under COMPRESS_MIN_SIZE bytes and
+streamed responses go out as they are.
+
+Responses with an ETag (the catalog lists and details) keep their compressed
+bytes in memory keyed by ETag and encoding, so each content version is
+compressed once and not on every request.
+"""
+import gzip
+import os
+from flask import request
+from cache import MemoryCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/html", "text/plain")
+
+
+def available_codecs(config):
+    # orden de preferencia si el cliente acepta varias con la misma q
+    codecs = {}
+    if zstandard is not None:
+        level = config["COMPRESS_ZSTD_LEVEL"]
+        codecs["zstd"] = lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    if brotli is not None:
+        level = config["COMPRESS_BR_LEVEL"]
+        codecs["br"] = lambda data: brotli.compress(data, quality=level)
+    level = config["COMPRESS_GZIP_LEVEL"]
+    codecs["gzip"] = lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    return codecs
+
+
+def negotiate(accept_encoding, codecs):
+    best, best_q = None, 0
+    for name in codecs:
+        q = accept_encoding.quality(name)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class Compressor:
+    """The codecs, COMPRESS_MIN_SIZE and the compressed bodies by ETag; shared with asgi.py."""
+
+    def __init__(self, config):
+        self.codecs = available_codecs(config)
+        self.min_size = config["COMPRESS_MIN_SIZE"]
+        self.cache = MemoryCache(max_entries=config["COMPRESS_CACHE_ENTRIES"], ttl=3600)
+
+    def encoding(self, accept_encoding, size):
+        """The codec to use for a body of ``size`` bytes, or None to send it as it is."""
+        if size is None or size < self.min_size:
+            return None
+        return negotiate(accept_encoding, self.codecs)
+
+    def compress(self, body, etag, encoding):
+        if etag is None:
+            return self.codecs[encoding](body)
+        key = "%s:%s" % (etag, encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = self.codecs[encoding](body)
+            self.cache.set(key, compressed)
+        return compressed
+
+
+def setup_compression(app):
+    app.config.setdefault("COMPRESS_MIN_SIZE", int(os.getenv("COMPRESS_MIN_SIZE", 1024)))
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", int(os.getenv("COMPRESS_GZIP_LEVEL", 6)))
+    app.config.setdefault("COMPRESS_BR_LEVEL", int(os.getenv("COMPRESS_BR_LEVEL", 5)))
+    app.config.setdefault("COMPRESS_ZSTD_LEVEL", int(os.getenv("COMPRESS_ZSTD_LEVEL", 3)))
+    app.config.setdefault("COMPRESS_CACHE_ENTRIES", int(os.getenv("COMPRESS_CACHE_ENTRIES", 256)))
+    compressor = Compressor(app.config)
+    app.extensions["compression"] = compressor
+
+    @app.after_request
+    def compress_response(response):
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or "Content-Encoding" in response.headers \
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = compressor.encoding(request.accept_encodings, response.content_length)
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        response.set_data(compressor.compress(response.get_data(), etag, encoding))
+        response.headers["Content-Encoding"] = encoding
+        if etag is not None:
+            # distinto contenido segun la codificacion: la ETag pasa a ser debil
+            response.set_etag(etag, weak=True)
+        return response
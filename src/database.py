@@ -0,0 +1,254 @@
+"""
+Engine configuration for the `db` extension.
+
+Pool options come from the environment (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING). Pool usage is published
+on /metrics, and the SQLite fallback database runs in WAL mode.
+
+Read replicas (DATABASE_REPLICA_URLS, comma separated) are optional. Views
+marked with @read_from_replica run their SELECTs on a replica, everything
+else (and any INSERT/UPDATE/DELETE, and flushes) stays on the primary:
+
+- After a successful POST/PUT/DELETE the client gets a cookie that pins it to
+  the primary for DB_REPLICA_PIN_SECONDS, so it reads its own writes.
+- A replica more than DB_REPLICA_MAX_LAG seconds behind is skipped. Lag is
+  published on /metrics as db_replica_lag_seconds.
+"""
+import functools
+import os
+import random
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import DateTime, column, event, func, select, table, text
+from sqlalchemy.pool import QueuePool
+from metrics import Counter, Gauge, Histogram
+
+POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection")
+POOL_CONNECTS = Counter("db_pool_connections_created_total", "New DBAPI connections opened by the pool")
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+POOL_INVALIDATIONS = Counter("db_pool_invalidations_total", "Connections discarded as invalid (failover, pre-ping)")
+ROUTED = Counter("db_routed_requests_total", "Replica-eligible requests by the database they read from", ["target"])
+
+PIN_COOKIE = "db_primary_until"
+# tablas con updated_at: su maximo marca hasta donde ha llegado cada base
+WATERMARK_TABLES = ("characters", "planets", "favoritos")
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return QueuePool._do_get(self)
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of @read_from_replica views to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, "is_dml", False):
+            replica = current_replica()
+            if replica is not None:
+                return replica
+        return Session.get_bind(self, mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaSet:
+
+    def __init__(self, primary, replicas, max_lag, lag_interval=1.0):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.lag_interval = lag_interval
+        self._lags = {}
+
+    def lag(self, index):
+        """Seconds ``replicas[index]`` is behind, cached for lag_interval."""
+        checked, value = self._lags.get(index, (0, None))
+        if time.monotonic() - checked > self.lag_interval:
+            try:
+                value = replica_lag(self.primary, self.replicas[index])
+            except Exception:
+                value = None
+            self._lags[index] = (time.monotonic(), value)
+        return value
+
+    def due(self):
+        """True when choose() has to measure some lag again."""
+        now = time.monotonic()
+        return any(now - self._lags.get(index, (0, None))[0] > self.lag_interval for index in range(len(self.replicas)))
+
+    def choose(self):
+        healthy = [index for index in range(len(self.replicas))
+                   if self.lag(index) is not None and self.lag(index) <= self.max_lag]
+        return self.replicas[random.choice(healthy)] if healthy else None
+
+
+def watermark(connection):
+    newest = None
+    for name in WATERMARK_TABLES:
+        value = connection.execute(select(func.max(table(name, column("updated_at", DateTime)).c.updated_at))).scalar()
+        if value is not None and (newest is None or value > newest):
+            newest = value
+    return newest
+
+
+def replica_lag(primary, replica):
+    if replica.dialect.name == "postgresql":
+        with replica.connect() as connection:
+            return float(connection.execute(text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")).scalar())
+    # sin estado de replicacion (SQLite): distancia entre la ultima escritura de cada una
+    with primary.connect() as connection:
+        primary_mark = watermark(connection)
+    with replica.connect() as connection:
+        replica_mark = watermark(connection)
+    if primary_mark is None:
+        return 0.0
+    if replica_mark is None:
+        return float("inf")
+    return max(0.0, (primary_mark - replica_mark).total_seconds())
+
+
+def current_replica():
+    if not has_request_context() or g.get("db_route") != "replica":
+        return None
+    if "db_replica" not in g:
+        replicas = g.db_replica_set
+        pinned = request.cookies.get(PIN_COOKIE, "")
+        if pinned.isdigit() and int(pinned) > time.time():
+            g.db_replica = None
+        else:
+            g.db_replica = replicas.choose()
+        ROUTED.inc(target="primary" if g.db_replica is None else "replica")
+    return g.db_replica
+
+
+def read_from_replica(view):
+    """Runs the SELECTs of ``view`` on a replica, when there is one."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = g.get("db_replica_set")
+        if replicas is not None:
+            g.db_route = "replica"
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Reads inside the block go to the primary, e.g. before writing what was read."""
+    route = g.pop("db_route", None) if has_request_context() else None
+    try:
+        yield
+    finally:
+        if route is not None:
+            g.db_route = route
+
+
+def env_flag(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+
+def engine_options(database_uri):
+    options = {
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    # sqlite en memoria usa su propio pool de una sola conexion
+    if database_uri != "sqlite://" and ":memory:" not in database_uri:
+        options.update({
+            "poolclass": TimedQueuePool,
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        })
+    return options
+
+
+def replica_urls(value):
+    return [url.strip().replace("postgres://", "postgresql://") for url in (value or "").split(",") if url.strip()]
+
+
+def setup_database(app, db):
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+    app.config.setdefault("DATABASE_REPLICA_URLS", os.getenv("DATABASE_REPLICA_URLS"))
+    app.config.setdefault("DB_REPLICA_PIN_SECONDS", int(os.getenv("DB_REPLICA_PIN_SECONDS", 5)))
+    app.config.setdefault("DB_REPLICA_MAX_LAG", float(os.getenv("DB_REPLICA_MAX_LAG", 10)))
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    replica_keys = []
+    for index, url in enumerate(replica_urls(app.config["DATABASE_REPLICA_URLS"])):
+        binds["replica_%d" % index] = url
+        replica_keys.append("replica_%d" % index)
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+        replicas = [db.engines[key] for key in replica_keys]
+
+    def on_connect(dbapi_connection, connection_record):
+        POOL_CONNECTS.inc()
+        if engine.dialect.name == "sqlite":
+            cursor = dbapi_connection.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+    for each_engine in [engine] + replicas:
+        event.listen(each_engine, "connect", on_connect)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc()
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        POOL_INVALIDATIONS.inc()
+
+    # engine.pool se lee en cada scrape, dispose() lo reemplaza
+    def pool_stat(method):
+        return lambda: getattr(engine.pool, method)() if hasattr(engine.pool, method) else None
+
+    Gauge("db_pool_size", "Configured pool size", callback=pool_stat("size"))
+    Gauge("db_pool_checked_out", "Connections currently checked out", callback=pool_stat("checkedout"))
+    overflow = pool_stat("overflow")
+    Gauge("db_pool_overflow", "Connections open beyond pool_size",
+          callback=lambda: max(overflow(), 0) if overflow() is not None else None)
+
+    if replicas:
+        setup_replicas(app, ReplicaSet(engine, replicas, app.config["DB_REPLICA_MAX_LAG"]))
+    return engine
+
+
+def setup_replicas(app, replica_set):
+    app.extensions["replicas"] = replica_set
+    pin_seconds = app.config["DB_REPLICA_PIN_SECONDS"]
+
+    Gauge("db_replica_lag_seconds", "How far each read replica is behind the primary", ["replica"],
+          callback=lambda: dict(((str(index),), replica_set.lag(index)) for index in range(len(replica_set.replicas))))
+
+    @app.before_request
+    def attach_replicas():
+        g.db_replica_set = replica_set
+
+    @app.after_request
+    def pin_to_primary(response):
+        # quien acaba de escribir lee del primario un rato (read-your-writes)
+        if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, str(int(time.time()) + pin_seconds), max_age=pin_seconds,
+                                httponly=True, samesite="Lax")
+        return response
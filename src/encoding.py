@@ -0,0 +1,103 @@
+"""
+JSON encoding helpers.
+
+OrjsonProvider replaces Flask's stdlib JSON provider when the optional
+`orjson` package is installed (JSON_PROVIDER=default keeps the stdlib one).
+
+row_encoder() turns a column tuple straight into the text of a JSON object,
+with the keys pre-encoded once per field list, so list endpoints do not build
+a dict per row before encoding it. It is about twice as fast as the stdlib
+encoder on dicts, but orjson on dicts is faster still, so by default
+(JSON_ROW_ENCODER=auto) it is only used when orjson is not installed.
+"""
+import json
+import os
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from flask.json.provider import DefaultJSONProvider
+from database import env_flag
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_scalar(value):
+    if orjson is not None:
+        return orjson.dumps(value, default=DefaultJSONProvider.default)
+    return json.dumps(value, default=DefaultJSONProvider.default).encode()
+
+
+def _value_source(column, index):
+    # expresion que pasa row[index] a texto JSON segun el tipo de la columna
+    value = "row[%d]" % index
+    python_type = column.type.python_type
+    if python_type is int:
+        converter = "str(%s)" % value
+    elif python_type is str:
+        converter = "escape(%s)" % value
+    else:
+        converter = "dumps(%s, default=default)" % value
+    return "('null' if %s is None else %s)" % (value, converter)
+
+
+@lru_cache(maxsize=128)
+def _row_encoder(model, fields):
+    order = sorted(range(len(fields)), key=lambda index: fields[index])
+    template = "{" + ",".join(json.dumps(fields[index]).replace("%", "%%") + ":%s" for index in order) + "}"
+    values = ", ".join(_value_source(getattr(model, fields[index]), index) for index in order)
+    namespace = {"template": template, "escape": encode_basestring_ascii,
+                 "dumps": json.dumps, "default": DefaultJSONProvider.default}
+    exec("def encode(row):\n    return template %% (%s,)" % values, namespace)
+    return namespace["encode"]
+
+
+def row_encoder(model, fields):
+    """
+    Returns a function row -> '{"field": value, ...}' for column tuples of
+    ``model`` in ``fields`` order. The function is generated once per field
+    list, like namedtuple does, so encoding a row is one string format with
+    no dict and no per-value encoder lookup. Keys are sorted, like jsonify.
+    """
+    return _row_encoder(model, tuple(fields))
+
+
+def encode_page(encode, rows, next_url):
+    """Body of a list response: {"next": ..., "results": [...]} as bytes."""
+    return b'{"next":' + encode_scalar(next_url) + b',"results":[' + ",".join(map(encode, rows)).encode() + b"]}\n"
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options()) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def setup_json(app):
+    app.config.setdefault("JSON_PROVIDER", os.getenv("JSON_PROVIDER", "orjson"))
+    use_orjson = orjson is not None and app.config["JSON_PROVIDER"] == "orjson"
+    # auto: el codificador por tuplas solo compensa sin orjson
+    if os.getenv("JSON_ROW_ENCODER", "auto").lower() == "auto":
+        app.config.setdefault("JSON_ROW_ENCODER", not use_orjson)
+    else:
+        app.config.setdefault("JSON_ROW_ENCODER", env_flag("JSON_ROW_ENCODER", False))
+    if use_orjson:
+        app.json = OrjsonProvider(app)
+    return app.json
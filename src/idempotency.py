@@ -0,0 +1,163 @@
+"""
+Idempotency-Key support for the POST endpoints that clients retry.
+
+A POST to /users, /users/<id>/favoritos/ or /users/<id>/favoritos/batch with
+an Idempotency-Key header runs once. Its response (any status below
+500) is kept for IDEMPOTENCY_TTL seconds, and a retry with the same key gets
+those bytes back, with Idempotent-Replayed: true, without running the view.
+
+- Lookups go to an in-process LRU (one dict lookup) and, on a miss, to the
+  idempotency_keys table by primary key, which every worker shares.
+- The same key with a different body answers 422; the same key while the
+  first request is still running in this worker answers 409.
+- Expired keys are deleted in bulk with one DELETE on created_at, at most
+  every IDEMPOTENCY_PRUNE_INTERVAL seconds, or with
+  `flask prune-idempotency-keys`.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app, g, jsonify, request, Response
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from cache import MemoryCache
+from models import db, IdempotencyKey
+
+HEADER = "Idempotency-Key"
+ENDPOINTS = ("api.create_user", "api.add_favorito", "api.add_favoritos_batch")
+
+
+def idempotency_key(key):
+    # el mismo valor en otra ruta es otra peticion
+    return hashlib.sha256(("%s %s %s" % (request.method, request.path, key)).encode()).hexdigest()
+
+
+def prune(ttl):
+    """Deletes every key older than ``ttl`` seconds in one statement."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    with db.engine.begin() as connection:
+        return connection.execute(db.delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)).rowcount
+
+
+class IdempotencyStore:
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.memory = MemoryCache(max_entries=max_entries, ttl=ttl)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def get(self, key):
+        """(request_hash, status, content_type, body) or None."""
+        entry = self.memory.get(key)
+        if entry is None:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            row = db.session.execute(db.select(IdempotencyKey.request_hash, IdempotencyKey.status_code,
+                                               IdempotencyKey.content_type, IdempotencyKey.body)
+                                     .where(IdempotencyKey.key == key, IdempotencyKey.created_at >= cutoff)).first()
+            if row is not None:
+                entry = tuple(row)
+                self.memory.set(key, entry)
+        return entry
+
+    def start(self, key):
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            return True
+
+    def finish(self, key):
+        with self._lock:
+            self._pending.discard(key)
+
+    def save(self, key, entry):
+        self.memory.set(key, entry)
+        request_hash, status_code, content_type, body = entry
+        # transaccion propia: no confirma nada que la vista dejara en la sesion
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(db.insert(IdempotencyKey), {
+                    "key": key, "request_hash": request_hash, "status_code": status_code,
+                    "content_type": content_type, "body": body, "created_at": datetime.utcnow()})
+        except IntegrityError:
+            # otro worker guardo la misma clave a la vez: vale la suya
+            pass
+
+    def maybe_prune(self, interval):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune < interval:
+                return
+            self._last_prune = now
+        prune(self.ttl)
+
+
+def replayed_response(entry):
+    request_hash, status_code, content_type, body = entry
+    response = Response(body, status=status_code, content_type=content_type)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def setup_idempotency(app):
+    app.config.setdefault("IDEMPOTENCY_TTL", int(os.getenv("IDEMPOTENCY_TTL", 86400)))
+    app.config.setdefault("IDEMPOTENCY_MAX_ENTRIES", int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", 10000)))
+    app.config.setdefault("IDEMPOTENCY_PRUNE_INTERVAL", int(os.getenv("IDEMPOTENCY_PRUNE_INTERVAL", 600)))
+    store = IdempotencyStore(app.config["IDEMPOTENCY_TTL"], app.config["IDEMPOTENCY_MAX_ENTRIES"])
+    app.extensions["idempotency"] = store
+    app.cli.add_command(prune_idempotency_keys_command)
+
+    @app.before_request
+    def replay_idempotent():
+        value = request.headers.get(HEADER)
+        if value is None or request.method != "POST" or request.endpoint not in ENDPOINTS:
+            return None
+        if not value or len(value) > 255:
+            return jsonify({"msg": "Idempotency-Key must be 1 to 255 characters"}), 400
+
+        key = idempotency_key(value)
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        entry = store.get(key)
+        if entry is not None:
+            if entry[0] != request_hash:
+                return jsonify({"msg": "Idempotency-Key already used with a different request"}), 422
+            return replayed_response(entry)
+        if not store.start(key):
+            return jsonify({"msg": "a request with this Idempotency-Key is in progress"}), 409
+        g.idempotency = (key, request_hash)
+        return None
+
+    @app.after_request
+    def save_idempotent(response):
+        pending = g.pop("idempotency", None)
+        if pending is None:
+            return response
+        key, request_hash = pending
+        try:
+            if response.status_code < 500 and not response.is_streamed:
+                store.save(key, (request_hash, response.status_code, response.content_type, response.get_data()))
+        finally:
+            store.finish(key)
+        store.maybe_prune(app.config["IDEMPOTENCY_PRUNE_INTERVAL"])
+        return response
+
+    @app.teardown_request
+    def release_idempotent(exception=None):
+        # la vista fallo antes de after_request: la clave queda libre para reintentar
+        pending = g.pop("idempotency", None)
+        if pending is not None:
+            store.finish(pending[0])
+
+
+@click.command("prune-idempotency-keys")
+@with_appcontext
+def prune_idempotency_keys_command():
+    """Delete expired Idempotency-Key responses."""
+    removed = prune(current_app.config["IDEMPOTENCY_TTL"])
+    click.echo(json.dumps({"removed": removed}))
@@ -0,0 +1,75 @@
+"""
+Per-request metrics: latency, response size, number of SQL queries and time
+spent in SQL, by endpoint. Published on /metrics; with SERVER_TIMING=1 every
+response also carries a Server-Timing header for the browser devtools.
+
+A jump in db_queries_per_request for an endpoint is the usual sign of an
+N+1 query pattern.
+"""
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from database import env_flag
+from metrics import Counter, Histogram
+
+REQUESTS = Counter("http_requests_total", "Requests served", ["endpoint", "method", "status"])
+LATENCY = Histogram("http_request_duration_seconds", "Request latency", ["endpoint", "method"])
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", ["endpoint"],
+                          buckets=(100, 1000, 10000, 100000, 1000000, 10000000))
+QUERY_COUNT = Histogram("db_queries_per_request", "SQL statements run by a request", ["endpoint"],
+                        buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+QUERY_TIME = Histogram("db_query_seconds_per_request", "Time spent in SQL by a request", ["endpoint"])
+
+
+def record(endpoint, method, status, elapsed, queries, sql_time, size):
+    """Publishes one request on /metrics (also used by the async routes of asgi.py)."""
+    REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    LATENCY.observe(elapsed, endpoint=endpoint, method=method)
+    QUERY_COUNT.observe(queries, endpoint=endpoint)
+    QUERY_TIME.observe(sql_time, endpoint=endpoint)
+    # los streams no tienen tamaño conocido
+    if size is not None:
+        RESPONSE_SIZE.observe(size, endpoint=endpoint)
+
+
+def server_timing(elapsed, sql_time, queries):
+    return 'app;dur=%.2f, db;dur=%.2f;desc="%d queries"' % (elapsed * 1000, sql_time * 1000, queries)
+
+
+def setup_instrumentation(app, engine):
+    app.config.setdefault("SERVER_TIMING", env_flag("SERVER_TIMING", False))
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        if has_request_context() and "sql_queries" in g:
+            g.sql_queries += 1
+            g.sql_time += elapsed
+
+    # las lecturas de @read_from_replica tambien cuentan en sql_queries / Server-Timing
+    replica_set = app.extensions.get("replicas")
+    for each_engine in [engine] + (replica_set.replicas if replica_set is not None else []):
+        event.listen(each_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(each_engine, "after_cursor_execute", after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if "request_start" not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or "unmatched"
+
+        record(endpoint, request.method, response.status_code, elapsed, g.sql_queries, g.sql_time,
+               response.content_length)
+
+        if app.config["SERVER_TIMING"]:
+            response.headers["Server-Timing"] = server_timing(elapsed, g.sql_time, g.sql_queries)
+        return response
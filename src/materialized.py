@@ -0,0 +1,185 @@
+"""
+Materialized favorites: one user_favoritos row per user with the JSON that
+/users/<id>/favoritos serves, so the endpoint is a primary key read.
+
+Kept up to date in the same transaction as the change:
+
+- Favorito rows added, edited or deleted through the session (the API
+  endpoints, Flask-Admin) or with Favorito.bulk_add/bulk_delete: the rows of
+  the users involved are recomputed before the commit.
+- A character or planet renamed or deleted: the rows of the users that have
+  it as a favorite are dropped and rebuilt on their next read.
+
+A missing row is always rebuilt on read, so `flask rebuild-favoritos` (which
+recomputes every row) is only needed to repair rows written outside the app.
+
+Two transactions changing the favorites of the same user would each compute
+the JSON without the other's change, and the last upsert would win. refresh()
+locks the users rows first (SELECT ... FOR NO KEY UPDATE on Postgres), so the
+second one waits for the first commit and computes with its favorites. SQLite
+already serializes writers. A rebuild on read only inserts a missing row and
+never overwrites one written in the meantime.
+"""
+import json
+import time
+import click
+from flask.cli import with_appcontext
+from database import use_primary
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Character, Favorito, Planet, User, UserFavoritos
+
+UPSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def dump(rows):
+    return json.dumps(Favorito.serialize_rows(rows), separators=(",", ":"))
+
+
+def compute(session, user_ids):
+    """{user_id: favoritos JSON} for ``user_ids``, in one query."""
+    rows_by_user = dict((user_id, []) for user_id in user_ids)
+    statement = Favorito.names_statement().where(Favorito.user_id.in_(user_ids)) \
+        .order_by(Favorito.user_id, Favorito.id)
+    for row in session.execute(statement):
+        rows_by_user[row[3]].append(row)
+    return dict((user_id, dump(rows)) for user_id, rows in rows_by_user.items())
+
+
+def store(session, documents, replace=True):
+    """Upserts ``documents``; with replace=False rows that already exist are left alone."""
+    if not documents:
+        return
+    values = [{"user_id": user_id, "favoritos": document} for user_id, document in documents.items()]
+    insert = UPSERTS.get(session.get_bind().dialect.name)
+    if insert is None:
+        if replace:
+            session.execute(db.delete(UserFavoritos).where(UserFavoritos.user_id.in_(documents)))
+        else:
+            existing = set(session.execute(db.select(UserFavoritos.user_id)
+                                           .where(UserFavoritos.user_id.in_(documents))).scalars())
+            values = [value for value in values if value["user_id"] not in existing]
+        if values:
+            session.execute(db.insert(UserFavoritos), values)
+        return
+    statement = insert(UserFavoritos)
+    if replace:
+        statement = statement.on_conflict_do_update(
+            index_elements=[UserFavoritos.user_id],
+            set_={"favoritos": statement.excluded.favoritos, "updated_at": db.func.now()})
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=[UserFavoritos.user_id])
+    session.execute(statement, values)
+
+
+def lock_users(session, user_ids):
+    # NO KEY UPDATE: no choca con el FOR KEY SHARE de la FK de favoritos.user_id,
+    # si con el de otra transaccion que refresca al mismo usuario; orden por id: sin deadlocks
+    session.execute(db.select(User.id).where(User.id.in_(user_ids)).order_by(User.id)
+                    .with_for_update(key_share=True))
+
+
+def refresh(session, user_ids):
+    user_ids = sorted(user_ids)
+    lock_users(session, user_ids)
+    store(session, compute(session, user_ids))
+
+
+def invalidate(session, characters_ids=(), planets_ids=()):
+    users = db.select(Favorito.user_id).where(db.or_(Favorito.characters_id.in_(characters_ids),
+                                                     Favorito.planets_id.in_(planets_ids)))
+    session.execute(db.delete(UserFavoritos).where(UserFavoritos.user_id.in_(users)))
+
+
+def load_favoritos(session, user_id):
+    """
+    The favoritos JSON of ``user_id``. Builds and commits the row when it is
+    missing (users without favorites are not stored).
+    """
+    document = session.execute(db.select(UserFavoritos.favoritos)
+                               .where(UserFavoritos.user_id == user_id)).scalar()
+    if document is None:
+        # se construye con lo que hay en el primario, no en una replica atrasada
+        with use_primary():
+            document = compute(session, [user_id])[user_id]
+            if document != "[]":
+                # si un commit del usuario escribio la fila mientras tanto, se queda la suya
+                store(session, {user_id: document}, replace=False)
+                session.commit()
+    return document
+
+
+@event.listens_for(Favorito.user_id, "set", active_history=True)
+def load_previous_user(target, value, oldvalue, initiator):
+    # active_history: al cambiar user_id se carga el anterior, que after_flush
+    # necesita para rehacer tambien la vista de ese usuario
+    pass
+
+
+def renamed_or_deleted(instance, deleted):
+    return deleted or inspect(instance).attrs.name.history.has_changes()
+
+
+def setup_materialized_favoritos(app, db):
+
+    @event.listens_for(db.session, "after_flush")
+    def collect_favoritos(session, flush_context):
+        users, stale = set(), {"characters": set(), "planets": set()}
+        for instances, deleted in ((session.new, False), (session.dirty, False), (session.deleted, True)):
+            for instance in instances:
+                if isinstance(instance, Favorito):
+                    # un favorito que cambia de usuario cambia las dos vistas
+                    history = inspect(instance).attrs.user_id.history
+                    users.update(user_id for user_id in (instance.user_id, *history.deleted) if user_id is not None)
+                elif isinstance(instance, (Character, Planet)) and renamed_or_deleted(instance, deleted):
+                    stale[instance.__tablename__].add(instance.id)
+        if users:
+            session.info.setdefault("favoritos_users", set()).update(users)
+        for table, ids in stale.items():
+            if ids:
+                session.info.setdefault("favoritos_stale", {}).setdefault(table, set()).update(ids)
+
+    @event.listens_for(db.session, "before_commit")
+    def update_favoritos(session):
+        # el flush de commit() llega despues de este evento: lo adelantamos
+        session.flush()
+        stale = session.info.pop("favoritos_stale", None)
+        if stale:
+            invalidate(session, stale.get("characters", ()), stale.get("planets", ()))
+        users = session.info.pop("favoritos_users", None)
+        if users:
+            refresh(session, users)
+
+    @event.listens_for(db.session, "after_rollback")
+    def forget_favoritos(session):
+        session.info.pop("favoritos_users", None)
+        session.info.pop("favoritos_stale", None)
+
+    app.cli.add_command(rebuild_favoritos_command)
+
+
+@click.command("rebuild-favoritos")
+@click.option("--batch-size", type=click.IntRange(min=1), default=1000, show_default=True)
+@with_appcontext
+def rebuild_favoritos_command(batch_size):
+    """Recompute every materialized /users/<id>/favoritos row."""
+    session = db.session
+    start = time.perf_counter()
+    removed = session.execute(db.delete(UserFavoritos)).rowcount
+    session.commit()
+
+    users, last = 0, 0
+    while True:
+        user_ids = session.execute(db.select(Favorito.user_id).distinct().where(Favorito.user_id > last)
+                                   .order_by(Favorito.user_id).limit(batch_size)).scalars().all()
+        if not user_ids:
+            break
+        refresh(session, user_ids)
+        session.commit()
+        users += len(user_ids)
+        last = user_ids[-1]
+        click.echo("rebuilt %d users" % users, err=True)
+
+    click.echo(json.dumps({"removed": removed, "rebuilt": users,
+                           "seconds": round(time.perf_counter() - start, 2)}, indent=2))
@@ -0,0 +1,144 @@
+"""
+Minimal Prometheus metrics (text exposition format), served on /metrics.
+
+Metrics register themselves in REGISTRY when created:
+
+    REQUESTS = Counter("http_requests_total", "Requests served", ["endpoint"])
+    REQUESTS.inc(endpoint="get_all_planets")
+"""
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, str(value).replace('"', '\\"')) for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # otra app en el mismo proceso (create_app de nuevo) sustituye sus gauges
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name]
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        items = self._items()
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, key), _format_value(value))
+                for key, value in items]
+
+
+class Gauge(Metric):
+    """
+    A value that is set, or read from ``callback`` every time it is scraped.
+    With labels the callback returns {(label values): value}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, callback=None):
+        Metric.__init__(self, name, documentation, labelnames, registry)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            items = sorted(value.items()) if self.labelnames else [((), value)]
+        else:
+            items = self._items()
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, key), _format_value(value))
+                for key, value in items if value is not None]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, documentation, labelnames, registry)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ((0,) * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        lines = []
+        for key, (counts, total) in self._items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (self.name, _format_labels(self.labelnames, key, ("le", _format_value(bound))), cumulative))
+            lines.append("%s_sum%s %s" % (self.name, _format_labels(self.labelnames, key), _format_value(total)))
+            lines.append("%s_count%s %d" % (self.name, _format_labels(self.labelnames, key), cumulative))
+        return lines
@@ -1,17 +1,32 @@
+from datetime import datetime
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# INSERT ... ON CONFLICT DO NOTHING de Favorito.bulk_add
+INSERT_IGNORE = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
 
 class Planet(db.Model):
     __tablename__ = 'planets'
+    serialize_fields = ("id", "name", "climate", "population", "orbital_period", "rotation_period", "diameter")
+    # /planets/search: texto libre sobre search_text, filtros sobre search_filters
+    search_text = ("name", "climate")
+    search_filters = ("climate", "population")
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=True)
-    climate = db.Column(db.String(250), nullable=True)
-    population = db.Column(db.Integer, nullable=True)
+    name = db.Column(db.String(250), nullable=True, index=True)
+    climate = db.Column(db.String(250), nullable=True, index=True)
+    population = db.Column(db.Integer, nullable=True, index=True)
     orbital_period  = db.Column(db.Integer, nullable=True)
     rotation_period = db.Column(db.Integer, nullable=True)
     diameter = db.Column(db.Integer, nullable=True)
-    # favoritos = db.relationship ('favoritos', backref= 'planets', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
+    # lo pone un trigger en cada INSERT/UPDATE (versions.py); el snapshot relee lo que supere su version
+    row_version = db.Column(db.BigInteger, nullable=False, index=True, server_default='0')
     def __repr__(self):
         return '<planets %r>' % self.id
 
@@ -30,15 +45,22 @@ class Planet(db.Model):
 
 class Character(db.Model):
     __tablename__ = 'characters'
+    serialize_fields = ("id", "name", "birth_year", "gender", "height", "skin_color", "eye_color")
+    # /characters/search: texto libre sobre search_text, filtros sobre search_filters
+    search_text = ("name",)
+    search_filters = ("gender", "height")
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=True)
+    name = db.Column(db.String(250), nullable=True, index=True)
     birth_year = db.Column(db.Integer, nullable=True)
-    gender = db.Column(db.String(250), nullable=True)
-    height = db.Column(db.Integer, nullable=True)
+    gender = db.Column(db.String(250), nullable=True, index=True)
+    height = db.Column(db.Integer, nullable=True, index=True)
     skin_color = db.Column(db.String(250), nullable=True)
     eye_color = db.Column(db.String(250), nullable=True)
-    # favoritos = db.relationship ('favoritos', backref= 'characters', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
+    # lo pone un trigger en cada INSERT/UPDATE (versions.py); el snapshot relee lo que supere su version
+    row_version = db.Column(db.BigInteger, nullable=False, index=True, server_default='0')
     def __repr__(self):
         return '<characters %r>' % self.id
 
@@ -56,48 +78,222 @@ class Character(db.Model):
     
 class Favorito(db.Model):
     __tablename__ = 'favoritos'
+    # un personaje una sola vez por usuario; un planeta una sola vez cuando
+    # el favorito es solo de planeta (igual que lo identifica del_favorito)
+    __table_args__ = (
+        db.Index('ix_favoritos_user_id_characters_id', 'user_id', 'characters_id', unique=True),
+        db.Index('ix_favoritos_user_id_planets_id', 'user_id', 'planets_id'),
+        db.Index('uq_favoritos_user_id_planets_id', 'user_id', 'planets_id', unique=True,
+                 sqlite_where=db.text('characters_id IS NULL'),
+                 postgresql_where=db.text('characters_id IS NULL')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     characters_id= db.Column(db.Integer, db.ForeignKey('characters.id'),nullable=True)
     planets_id= db.Column(db.Integer, db.ForeignKey('planets.id'),nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
                         nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
+    character = db.relationship('Character', backref='favoritos', lazy='joined')
+    planet = db.relationship('Planet', backref='favoritos', lazy='joined')
+    user = db.relationship('User', backref='favoritos', lazy=True)
+
     def __repr__(self):
         return '<favoritos %r>' % self.id
 
     def serialize(self):
-        character_query= Character.query.filter_by(id= self.characters_id).first()
-
-        if character_query is None:
-          character_resultado=  None
-        else:
-          character_resultado= character_query.serialize()['name']
-
-        planet_query= Planet.query.filter_by(id= self.planets_id).first()
-
-        if planet_query is None:
-          planet_resultado=  None
-        else:
-          planet_resultado= planet_query.serialize()['name']
-        
-
+        snapshot = current_app.extensions.get('catalog_snapshot') if has_app_context() else None
+        if snapshot is not None:
+            # los nombres salen de la copia en memoria del catalogo (snapshot.py)
+            return {
+                "id": self.id,
+                "characters": snapshot.name(Character, self.characters_id),
+                "planets": snapshot.name(Planet, self.planets_id),
+                "user_id": self.user_id
+            }
+        # character y planet vienen en el mismo SELECT (lazy='joined'),
+        # asi no hacemos dos queries extra por cada favorito
         return {
             "id": self.id,
-            "characters": character_resultado,
-            "planets": planet_resultado,
+            "characters": self.character.name if self.character is not None else None,
+            "planets": self.planet.name if self.planet is not None else None,
             "user_id": self.user_id
-            # do not serialize the password, its a security breach // planet_query.serialize()['name'] // character_query.serialize()['name']
+            # do not serialize the password, its a security breach
         }
+
+    @staticmethod
+    def names_statement():
+        # favoritos con los nombres en una sola query (LEFT JOIN),
+        # sin construir los objetos Character/Planet
+        return db.select(Favorito.id, Character.name, Planet.name, Favorito.user_id) \
+            .outerjoin(Character, Favorito.characters_id == Character.id) \
+            .outerjoin(Planet, Favorito.planets_id == Planet.id)
+
+    @staticmethod
+    def by_user_statement(user_id):
+        return Favorito.names_statement().where(Favorito.user_id == user_id).order_by(Favorito.id)
+
+    @staticmethod
+    def serialize_rows(rows):
+        return [{
+            "id": row[0],
+            "characters": row[1],
+            "planets": row[2],
+            "user_id": row[3]
+        } for row in rows]
+
+    @staticmethod
+    def _pair(item):
+        return (item.get("characters_id"), item.get("planets_id"))
+
+    @staticmethod
+    def valid_pair(pair):
+        # listas, textos o true en el JSON no llegan a ninguna query (TypeError, DataError)
+        return all(value is None or type(value) is int and 0 < value < 2 ** 31 for value in pair)
+
+    @staticmethod
+    def identity(characters_id, planets_id):
+        # lo que miran los indices unicos: el personaje, o el planeta si no hay personaje
+        if characters_id is not None:
+            return (characters_id, None)
+        return (None, planets_id)
+
+    @staticmethod
+    def bulk_add(user_id, items):
+        """
+        Adds every {characters_id, planets_id} in ``items`` with one query per
+        table for validation and a single multi-row INSERT. Does not commit.
+        Returns one outcome per item: created, exists, duplicate or invalid;
+        exists and duplicate compare what the unique indexes compare (identity()).
+        On SQLite and Postgres a row another transaction inserted after the
+        read is skipped (ON CONFLICT DO NOTHING) and reported as exists.
+        """
+        pairs = [Favorito._pair(item) for item in items]
+        valid = [pair for pair in pairs if Favorito.valid_pair(pair)]
+        character_ids = set(pair[0] for pair in valid if pair[0] is not None)
+        planet_ids = set(pair[1] for pair in valid if pair[1] is not None)
+
+        known_characters = set(row[0] for row in db.session.query(Character.id).filter(Character.id.in_(character_ids))) if character_ids else set()
+        known_planets = set(row[0] for row in db.session.query(Planet.id).filter(Planet.id.in_(planet_ids))) if planet_ids else set()
+        existing = set(Favorito.identity(*row) for row in
+                       db.session.query(Favorito.characters_id, Favorito.planets_id).filter(Favorito.user_id == user_id))
+
+        outcomes, mappings, seen = [], [], set()
+        for characters_id, planets_id in pairs:
+            if not Favorito.valid_pair((characters_id, planets_id)) \
+                    or (characters_id is None and planets_id is None) \
+                    or (characters_id is not None and characters_id not in known_characters) \
+                    or (planets_id is not None and planets_id not in known_planets):
+                outcome = "invalid"
+            elif Favorito.identity(characters_id, planets_id) in existing:
+                outcome = "exists"
+            elif Favorito.identity(characters_id, planets_id) in seen:
+                outcome = "duplicate"
+            else:
+                outcome = "created"
+                seen.add(Favorito.identity(characters_id, planets_id))
+                mappings.append({"user_id": user_id, "characters_id": characters_id, "planets_id": planets_id})
+            outcomes.append({"characters_id": characters_id, "planets_id": planets_id, "result": outcome})
+
+        if mappings:
+            insert = INSERT_IGNORE.get(db.session.get_bind().dialect.name)
+            if insert is None:
+                db.session.execute(db.insert(Favorito), mappings)
+            else:
+                statement = insert(Favorito).on_conflict_do_nothing() \
+                    .returning(Favorito.characters_id, Favorito.planets_id)
+                created = set(Favorito.identity(*row) for row in db.session.execute(statement, mappings))
+                for outcome in outcomes:
+                    if outcome["result"] == "created" \
+                            and Favorito.identity(outcome["characters_id"], outcome["planets_id"]) not in created:
+                        outcome["result"] = "exists"
+            # INSERT sin pasar por el flush: avisamos a la vista materializada
+            db.session.info.setdefault("favoritos_users", set()).add(user_id)
+        return outcomes
+
+    @staticmethod
+    def bulk_delete(user_id, items):
+        """
+        Deletes the favorites matching ``items`` (by characters_id, or by
+        planets_id when characters_id is null, like del_favorito) with a
+        single DELETE. Does not commit. Outcomes: deleted, not_found or invalid.
+        """
+        pairs = [Favorito._pair(item) for item in items]
+        valid = [pair for pair in pairs if Favorito.valid_pair(pair)]
+        character_ids = set(pair[0] for pair in valid if pair[0] is not None)
+        planet_ids = set(pair[1] for pair in valid if pair[0] is None and pair[1] is not None)
+
+        matches = db.or_(Favorito.characters_id.in_(character_ids),
+                         db.and_(Favorito.characters_id.is_(None), Favorito.planets_id.in_(planet_ids)))
+        rows = db.session.query(Favorito.id, Favorito.characters_id, Favorito.planets_id) \
+            .filter(Favorito.user_id == user_id, matches).all()
+
+        found_characters = set(row[1] for row in rows if row[1] is not None)
+        found_planets = set(row[2] for row in rows if row[1] is None)
+        if rows:
+            db.session.execute(db.delete(Favorito).where(Favorito.id.in_([row[0] for row in rows])))
+            db.session.info.setdefault("favoritos_users", set()).add(user_id)
+
+        outcomes = []
+        for characters_id, planets_id in pairs:
+            if not Favorito.valid_pair((characters_id, planets_id)):
+                result = "invalid"
+            elif characters_id is not None:
+                result = "deleted" if characters_id in found_characters else "not_found"
+            else:
+                result = "deleted" if planets_id in found_planets else "not_found"
+            outcomes.append({"characters_id": characters_id, "planets_id": planets_id, "result": result})
+        return outcomes
     
 
 
 
+class UserFavoritos(db.Model):
+    """
+    Materialized /users/<id>/favoritos: the serialized favorites of a user
+    (as Favorito.serialize_rows) in one row, kept up to date by materialized.py.
+    """
+    __tablename__ = 'user_favoritos'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    favoritos = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
+
+    def __repr__(self):
+        return '<user_favoritos %r>' % self.user_id
+
+
+class TableVersion(db.Model):
+    """Change counter of a table, bumped by triggers on every write (see versions.py)."""
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return '<table_versions %r>' % self.name
+
+
+class IdempotencyKey(db.Model):
+    """Stored response of a POST sent with an Idempotency-Key (see idempotency.py)."""
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(64), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(120), nullable=False)
+    body = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<idempotency_keys %r>' % self.key
+
+
 class User(db.Model):
     __tablename__ = 'users'
+    serialize_fields = ("id", "email")
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(80), unique=False, nullable=False)
+    password = db.Column(db.String(255), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
-    # favoritos = db.relationship ('favoritos', backref= 'users', lazy=True)
 
 
     def __repr__(self):
@@ -0,0 +1,123 @@
+"""
+OpenAPI 3 document for the API, served on /openapi.json.
+
+Built once from the url map: every route of the api blueprint with its path
+parameters and methods, the summary from the view docstring (or its name),
+and the model schemas from their serialize_fields columns. The list, search
+and write endpoints get their query parameters and request bodies from
+ENDPOINTS below.
+"""
+import re
+from models import Character, Planet, User
+
+PATH_PARAMETER = re.compile(r"<(?:(\w+):)?(\w+)>")
+CONVERTER_TYPES = {"int": "integer", "float": "number"}
+SCHEMA_TYPES = {int: "integer", float: "number", bool: "boolean", str: "string"}
+
+PAGE_PARAMETERS = [
+    {"name": "limit", "in": "query", "schema": {"type": "integer"}, "description": "page size"},
+    {"name": "after", "in": "query", "schema": {"type": "string"}, "description": "cursor from the previous page's next"},
+    {"name": "fields", "in": "query", "schema": {"type": "string"}, "description": "comma separated columns"},
+]
+STREAM_PARAMETER = {"name": "stream", "in": "query", "schema": {"type": "boolean"},
+                    "description": "export every row as NDJSON"}
+SEARCH_PARAMETERS = [{"name": "q", "in": "query", "schema": {"type": "string"}, "description": "full text"}] \
+    + PAGE_PARAMETERS
+FAVORITO_BODY = {"type": "object", "properties": {
+    "characters_id": {"type": "integer", "nullable": True},
+    "planets_id": {"type": "integer", "nullable": True}}}
+
+# endpoint -> (schema of each result, query parameters, request body)
+ENDPOINTS = {
+    "get_all_characters": ("Character", PAGE_PARAMETERS + [STREAM_PARAMETER], None),
+    "get_one_characters": ("Character", [], None),
+    "search_characters": ("Character", SEARCH_PARAMETERS, None),
+    "get_all_planets": ("Planet", PAGE_PARAMETERS + [STREAM_PARAMETER], None),
+    "get_one_planets": ("Planet", [], None),
+    "search_planets": ("Planet", SEARCH_PARAMETERS, None),
+    "get_all_users": ("User", PAGE_PARAMETERS + [STREAM_PARAMETER], None),
+    "get_favoritos": ("Favorito", [{"name": "all", "in": "query", "schema": {"type": "boolean"},
+                                    "description": "every favorite instead of the first one"}], None),
+    "add_favorito": (None, [], FAVORITO_BODY),
+    "add_favoritos_batch": (None, [], {"type": "array", "items": FAVORITO_BODY}),
+    "del_favorito": (None, [], FAVORITO_BODY),
+    "del_favoritos_batch": (None, [], {"type": "array", "items": FAVORITO_BODY}),
+    "create_user": (None, [], {"type": "object", "required": ["email", "password", "is_active"], "properties": {
+        "email": {"type": "string"}, "password": {"type": "string"}, "is_active": {"type": "boolean"}}}),
+    "get_single_user": ("User", [], {"type": "object", "properties": {"email": {"type": "string"}}}),
+    "login": (None, [], {"type": "object", "properties": {
+        "email": {"type": "string"}, "password": {"type": "string"}}}),
+}
+
+
+# vistas con @jwt_required()
+AUTHENTICATED = ("get_profile",)
+
+
+def model_schema(model):
+    properties = {}
+    for field in model.serialize_fields:
+        column = model.__table__.c[field]
+        properties[field] = {"type": SCHEMA_TYPES.get(column.type.python_type, "string")}
+        if column.nullable:
+            properties[field]["nullable"] = True
+    return {"type": "object", "properties": properties}
+
+
+def schemas():
+    result = dict((model.__name__, model_schema(model)) for model in (Character, Planet, User))
+    # /users/<id>/favoritos devuelve nombres, no ids (Favorito.serialize_rows)
+    result["Favorito"] = {"type": "object", "properties": {
+        "id": {"type": "integer"}, "characters": {"type": "string", "nullable": True},
+        "planets": {"type": "string", "nullable": True}, "user_id": {"type": "integer"}}}
+    return result
+
+
+def operation(app, rule, method):
+    name = rule.endpoint.rsplit(".", 1)[-1]
+    view = app.view_functions[rule.endpoint]
+    doc = (view.__doc__ or "").strip()
+    schema, query, body = ENDPOINTS.get(name, (None, [], None))
+
+    parameters = [{"name": param, "in": "path", "required": True,
+                   "schema": {"type": CONVERTER_TYPES.get(converter, "string")}}
+                  for converter, param in PATH_PARAMETER.findall(rule.rule)]
+    if method in ("GET", "DELETE"):
+        parameters += query
+
+    content = {"application/json": {}}
+    if schema is not None:
+        results = {"$ref": "#/components/schemas/" + schema}
+        properties = {"results": results}
+        if name.startswith(("get_all_", "search_")):
+            properties = {"results": {"type": "array", "items": results},
+                          "next": {"type": "string", "nullable": True}}
+        content["application/json"]["schema"] = {"type": "object", "properties": properties}
+    result = {"operationId": "%s_%s" % (name, method.lower()),
+              "summary": doc.splitlines()[0] if doc else name.replace("_", " "),
+              "parameters": parameters,
+              "responses": {"200": {"description": "OK", "content": content}}}
+    if body is not None and method in ("POST", "PUT", "DELETE"):
+        result["requestBody"] = {"content": {"application/json": {"schema": body}}}
+    if name in AUTHENTICATED:
+        result["security"] = [{"bearerAuth": []}]
+    return result
+
+
+def build_openapi(app, title="StarWars REST API", version="1.0.0"):
+    paths = {}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if not rule.endpoint.startswith("api."):
+            continue
+        path = PATH_PARAMETER.sub(r"{\2}", rule.rule)
+        for method in sorted(rule.methods - {"HEAD", "OPTIONS"}):
+            paths.setdefault(path, {})[method.lower()] = operation(app, rule, method)
+    return {
+        "openapi": "3.0.3",
+        "info": {"title": title, "version": version},
+        "paths": paths,
+        "components": {
+            "schemas": schemas(),
+            "securitySchemes": {"bearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}},
+        },
+    }
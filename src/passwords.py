@@ -0,0 +1,102 @@
+"""
+Password hashing for User.password.
+
+Hashes are PBKDF2-SHA256 stored as ``pbkdf2_sha256$<iterations>$<salt>$<hash>``.
+The cost is set with PASSWORD_HASH_ITERATIONS; hashes made with a lower cost
+(or old plaintext passwords) are upgraded on the next successful login.
+
+hashlib releases the GIL while it derives the key, so the work runs on a small
+bounded thread pool: a burst of logins can use at most PASSWORD_HASH_WORKERS
+cores and the rest of the requests keep being served. The request thread still
+waits for its hash, so that only holds when the worker serves other requests
+meanwhile: gunicorn's gthread worker (Procfile, render.yml) or an ASGI server.
+A sync worker is blocked for the whole hash either way.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils import APIException
+
+ALGORITHM = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 600000
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(value):
+    return base64.b64decode(value + "=" * (-len(value) % 4))
+
+
+def hash_password(password, iterations=DEFAULT_ITERATIONS, salt=None):
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return "%s$%d$%s$%s" % (ALGORITHM, iterations, _b64(salt), _b64(digest))
+
+
+def is_hashed(stored):
+    return stored.startswith(ALGORITHM + "$")
+
+
+def check_password(password, stored):
+    if password is None or stored is None:
+        return False
+    if not is_hashed(stored):
+        # contraseñas guardadas antes del hashing
+        return hmac.compare_digest(password.encode(), stored.encode())
+    _, iterations, salt, digest = stored.split("$")
+    expected = hashlib.pbkdf2_hmac("sha256", password.encode(), _unb64(salt), int(iterations))
+    return hmac.compare_digest(expected, _unb64(digest))
+
+
+def needs_rehash(stored, iterations=DEFAULT_ITERATIONS):
+    if not is_hashed(stored):
+        return True
+    return int(stored.split("$")[1]) != iterations
+
+
+class PasswordHasher:
+
+    def __init__(self, iterations=DEFAULT_ITERATIONS, workers=2, max_pending=32, timeout=5):
+        self.iterations = iterations
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="passwords")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _run(self, fn, *args):
+        # si ya hay demasiados logins esperando, mejor un 503 que una cola sin fin
+        if not self._slots.acquire(timeout=self.timeout):
+            raise APIException("too many login attempts, try again later", status_code=503)
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.iterations)
+
+    def verify(self, password, stored):
+        """
+        Returns (valid, new_hash). ``new_hash`` is not None when the stored
+        value should be replaced because it uses an old cost or plaintext.
+        """
+        if not self._run(check_password, password, stored):
+            return False, None
+        if needs_rehash(stored, self.iterations):
+            return True, self.hash(password)
+        return True, None
+
+
+def setup_passwords(app):
+    app.config.setdefault("PASSWORD_HASH_ITERATIONS", int(os.getenv("PASSWORD_HASH_ITERATIONS", DEFAULT_ITERATIONS)))
+    app.config.setdefault("PASSWORD_HASH_WORKERS", int(os.getenv("PASSWORD_HASH_WORKERS", 2)))
+    app.config.setdefault("PASSWORD_HASH_MAX_PENDING", int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32)))
+    hasher = PasswordHasher(iterations=app.config["PASSWORD_HASH_ITERATIONS"],
+                            workers=app.config["PASSWORD_HASH_WORKERS"],
+                            max_pending=app.config["PASSWORD_HASH_MAX_PENDING"])
+    app.extensions["passwords"] = hasher
+    return hasher
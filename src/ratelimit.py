@@ -0,0 +1,209 @@
+"""
+Rate limiting for /login and the write endpoints, plus load shedding.
+
+Every client gets a token bucket per rule, keyed by IP and, when the request
+carries a valid JWT, by identity too. A request spends one token from each
+of its buckets; an empty bucket answers 429 with Retry-After.
+
+Buckets live in a sharded in-memory store (one lock per shard, so workers'
+threads rarely wait on each other) or, with RATELIMIT_STORAGE_URL, in Redis so
+all workers share them.
+
+Independently, at most MAX_CONCURRENT_REQUESTS requests run at once in a
+worker; the rest get an immediate 503 with Retry-After instead of queueing
+for a database connection.
+
+RATELIMIT_TRUST_PROXY is the number of proxies in front of the app. The
+client IP is then taken from X-Forwarded-For by ProxyFix, counting that many
+hops from the right, so a client cannot pick its own bucket. It defaults to
+1 on Render and Heroku (the RENDER and DYNO variables they set) and to 0
+anywhere else, where every request would otherwise share the proxy's IP.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from database import env_flag
+from metrics import Counter, Gauge
+
+# el balanceador tiene que ver el proceso vivo aunque este saturado
+NOT_SHED = ("api.healthz",)
+
+RATE_LIMITED = Counter("ratelimit_rejected_total", "Requests answered 429 by the rate limiter", ["rule"])
+SHED = Counter("requests_shed_total", "Requests answered 503 because MAX_CONCURRENT_REQUESTS were in flight")
+
+
+class MemoryBuckets:
+
+    def __init__(self, shards=16, max_keys=10000):
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self.max_keys_per_shard = max(1, max_keys // shards)
+
+    def allow(self, key, rate, burst):
+        """Takes a token from ``key``. Returns (allowed, seconds until the next token)."""
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, last = buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+            if len(buckets) > self.max_keys_per_shard:
+                buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
+class RedisBuckets:
+    """Same buckets in Redis, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+    local tokens, last = tonumber(state[1]) or burst, tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - last) * rate)
+    local allowed = 0
+    if tokens >= 1 then tokens = tokens - 1; allowed = 1 end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'last', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix="swapi:ratelimit:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def allow(self, key, rate, burst):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[rate, burst, time.time()])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+
+class RequestSlots:
+    """At most ``size`` requests at once, without waiting; also used by asgi.py."""
+
+    def __init__(self, size):
+        self.size = size
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_use >= self.size:
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+
+
+def create_buckets(config):
+    url = config.get("RATELIMIT_STORAGE_URL")
+    if url:
+        return RedisBuckets(url)
+    return MemoryBuckets()
+
+
+def parse_rule(value):
+    """"5/60" -> 5 requests every 60 seconds, as (tokens per second, burst)."""
+    count, seconds = value.split("/")
+    return float(count) / float(seconds), float(count)
+
+
+def proxy_hops(value):
+    # "true"/"yes" de antes de contar saltos valen como un proxy
+    value = str(value).lower()
+    if value in ("true", "yes"):
+        return 1
+    if value in ("false", "no", ""):
+        return 0
+    return int(value)
+
+
+def client_keys():
+    # con RATELIMIT_TRUST_PROXY, ProxyFix ya puso aqui la IP del cliente
+    keys = ["ip:%s" % request.remote_addr]
+    if "Authorization" in request.headers:
+        try:
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+        except Exception:
+            identity = None
+        if identity is not None:
+            keys.append("user:%s" % identity)
+    return keys
+
+
+def too_many_requests(status_code, msg, retry_after):
+    response = jsonify({"msg": msg})
+    response.status_code = status_code
+    response.headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+def setup_ratelimit(app):
+    app.config.setdefault("RATELIMIT_ENABLED", env_flag("RATELIMIT_ENABLED", True))
+    app.config.setdefault("RATELIMIT_STORAGE_URL", os.getenv("RATELIMIT_STORAGE_URL"))
+    app.config.setdefault("RATELIMIT_LOGIN", os.getenv("RATELIMIT_LOGIN", "10/60"))
+    app.config.setdefault("RATELIMIT_WRITE", os.getenv("RATELIMIT_WRITE", "60/60"))
+    behind_proxy = os.getenv("RENDER") is not None or os.getenv("DYNO") is not None
+    app.config.setdefault("RATELIMIT_TRUST_PROXY",
+                          proxy_hops(os.getenv("RATELIMIT_TRUST_PROXY", 1 if behind_proxy else 0)))
+    engine_options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    default_concurrency = engine_options.get("pool_size", 5) + engine_options.get("max_overflow", 10)
+    app.config.setdefault("MAX_CONCURRENT_REQUESTS", int(os.getenv("MAX_CONCURRENT_REQUESTS", default_concurrency)))
+
+    buckets = create_buckets(app.config)
+    rules = {
+        "login": parse_rule(app.config["RATELIMIT_LOGIN"]),
+        "write": parse_rule(app.config["RATELIMIT_WRITE"]),
+    }
+    in_flight = RequestSlots(app.config["MAX_CONCURRENT_REQUESTS"])
+    app.extensions["ratelimit"] = buckets
+    # asgi.py toma el mismo hueco en sus rutas async
+    app.extensions["request_slots"] = in_flight
+    Gauge("requests_in_flight", "Requests currently holding a concurrency slot",
+          callback=lambda: in_flight.in_use)
+    if app.config["RATELIMIT_TRUST_PROXY"]:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["RATELIMIT_TRUST_PROXY"])
+
+    @app.before_request
+    def shed_and_limit():
+        if request.endpoint in NOT_SHED:
+            return None
+        # por encima del maximo respondemos ya, antes de pedir conexion al pool
+        if not in_flight.acquire():
+            SHED.inc()
+            return too_many_requests(503, "server busy, try again later", 1)
+        request.environ["ratelimit.slot"] = True
+
+        if not app.config["RATELIMIT_ENABLED"]:
+            return None
+        if request.endpoint == "api.login":
+            rule = "login"
+        elif request.method in ("POST", "PUT", "DELETE"):
+            rule = "write"
+        else:
+            return None
+
+        rate, burst = rules[rule]
+        for key in client_keys():
+            allowed, retry_after = buckets.allow("%s:%s" % (rule, key), rate, burst)
+            if not allowed:
+                RATE_LIMITED.inc(rule=rule)
+                return too_many_requests(429, "too many requests", retry_after)
+        return None
+
+    @app.teardown_request
+    def release_slot(exception=None):
+        if request.environ.pop("ratelimit.slot", False):
+            in_flight.release()
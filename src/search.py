@@ -0,0 +1,170 @@
+"""
+Search over characters and planets (/search, /characters/search, /planets/search).
+
+Free text (?q=) runs on the database full text engine:
+
+- SQLite: an FTS5 table per model (<table>_fts) kept in sync by triggers,
+  ranked with bm25.
+- Postgres: a GIN index on to_tsvector('simple', ...) ranked with ts_rank,
+  plus a pg_trgm index on name so partial words still match.
+
+Any other database, or a SQLite file without the FTS tables, falls back to a
+LIKE over the same columns. Structured filters (?gender=female&height<=180,
+also written height__lte=180) use the B-tree indexes on those columns.
+"""
+from sqlalchemy import DDL, and_, column, event, func, literal_column, or_, select, table, text
+from utils import APIException, decode_cursor, encode_cursor, parse_fields, parse_limit
+
+RESERVED_ARGS = ("q", "limit", "after", "fields")
+_fts_tables = {}
+
+
+def fts_table_name(model):
+    return model.__tablename__ + "_fts"
+
+
+def tsvector_sql(search_text):
+    document = " || ' ' || ".join("coalesce(%s, '')" % field for field in search_text)
+    return "to_tsvector('simple', %s)" % document
+
+
+def sqlite_ddl(model):
+    name, fts = model.__tablename__, fts_table_name(model)
+    fields = ", ".join(model.search_text)
+    new_values = ", ".join("new." + field for field in model.search_text)
+    old_values = ", ".join("old." + field for field in model.search_text)
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', content_rowid='id')" % (fts, fields, name),
+        "CREATE TRIGGER IF NOT EXISTS %s_ai AFTER INSERT ON %s BEGIN "
+        "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (fts, name, fts, fields, new_values),
+        "CREATE TRIGGER IF NOT EXISTS %s_ad AFTER DELETE ON %s BEGIN "
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END" % (fts, name, fts, fts, fields, old_values),
+        # solo las columnas indexadas: el sello de row_version (versions.py) no toca el indice
+        "CREATE TRIGGER IF NOT EXISTS %s_au AFTER UPDATE OF %s ON %s BEGIN "
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+        "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (fts, fields, name, fts, fts, fields, old_values, fts, fields, new_values),
+        "INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts),
+    ]
+
+
+def postgresql_ddl(name, search_text):
+    """Takes the table name and columns, not the model: migration 5d2b7e9f31a8 runs it too."""
+    return [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_%s_fts ON %s USING GIN (%s)" % (name, name, tsvector_sql(search_text)),
+        "CREATE INDEX IF NOT EXISTS ix_%s_name_trgm ON %s USING GIN (name gin_trgm_ops)" % (name, name),
+    ]
+
+
+def register_search_ddl(*models):
+    """Creates the search objects together with the tables in db.create_all()."""
+    for model in models:
+        for statement in sqlite_ddl(model):
+            event.listen(model.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+        for statement in postgresql_ddl(model.__tablename__, model.search_text):
+            event.listen(model.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+        event.listen(model.__table__, "after_drop",
+                     DDL("DROP TABLE IF EXISTS %s" % fts_table_name(model)).execute_if(dialect="sqlite"))
+
+
+def has_fts(session, model):
+    key = (str(session.get_bind().url), model.__tablename__)
+    if key not in _fts_tables:
+        found = session.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                {"name": fts_table_name(model)}).first()
+        _fts_tables[key] = found is not None
+    return _fts_tables[key]
+
+
+def parse_filters(model, args):
+    criteria = []
+    for key, value in args.items():
+        if key in RESERVED_ARGS:
+            continue
+        # "height<=180" llega como clave "height<" y valor "180"
+        field, operator = key, "eq"
+        for suffix, name in (("__gte", "gte"), ("__lte", "lte"), (">", "gte"), ("<", "lte")):
+            if key.endswith(suffix):
+                field, operator = key[:-len(suffix)], name
+                break
+        if field not in model.search_filters:
+            raise APIException("unknown filter: " + key, status_code=400)
+
+        attribute = getattr(model, field)
+        if attribute.type.python_type is int:
+            try:
+                value = int(value)
+            except ValueError:
+                raise APIException(field + " must be an integer", status_code=400)
+        elif operator != "eq":
+            raise APIException(field + " only supports equality", status_code=400)
+
+        if operator == "gte":
+            criteria.append(attribute >= value)
+        elif operator == "lte":
+            criteria.append(attribute <= value)
+        else:
+            criteria.append(attribute == value)
+    return criteria
+
+
+def fts_query(q):
+    # cada palabra como prefijo literal, sin la sintaxis de FTS5
+    return " ".join('"%s"*' % word.replace('"', '""') for word in q.split())
+
+
+def rank_cursor(value):
+    # "rank:id"; repr() del float vuelve exacto con float()
+    rank, last_id = value.split(":")
+    return float(rank), int(last_id)
+
+
+def search_page(session, model, args, default_limit=100, max_limit=1000):
+    """
+    One page of search results for ``model``. Returns (results, next_cursor).
+    Ranked text searches are paginated by (rank, id) keyset; filter-only and
+    LIKE searches by primary key like the list endpoints.
+    """
+    limit = parse_limit(args.get("limit"), default_limit, max_limit)
+    fields = parse_fields(model, args.get("fields"))
+    criteria = parse_filters(model, args)
+    q = (args.get("q") or "").strip()
+    after = args.get("after")
+
+    statement = select(*[getattr(model, field) for field in fields]).where(*criteria)
+
+    dialect = session.get_bind().dialect.name
+    rank = None
+    if q and dialect == "postgresql":
+        vector = literal_column(tsvector_sql(model.search_text))
+        query = func.plainto_tsquery("simple", q)
+        statement = statement.where(or_(vector.op("@@")(query), model.name.op("%")(q)))
+        # negado: mejor puntuacion primero con el mismo orden ascendente que bm25
+        rank = -(func.ts_rank(vector, query) + func.similarity(model.name, q))
+    elif q and dialect == "sqlite" and has_fts(session, model):
+        fts = table(fts_table_name(model), column("rowid"), column("rank"))
+        statement = statement.join(fts, fts.c.rowid == model.id) \
+            .where(literal_column(fts_table_name(model)).op("MATCH")(fts_query(q)))
+        rank = fts.c.rank
+    elif q:
+        # % y _ del texto buscado son literales
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        statement = statement.where(or_(*[getattr(model, field).ilike(pattern, escape="\\")
+                                          for field in model.search_text]))
+
+    if rank is None:
+        if after:
+            statement = statement.where(model.id > decode_cursor(after))
+        rows = session.execute(statement.order_by(model.id).limit(limit + 1)).all()
+        next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        return [dict(zip(fields, row)) for row in rows[:limit]], next_cursor
+
+    if after:
+        last_rank, last_id = decode_cursor(after, rank_cursor)
+        statement = statement.where(or_(rank > last_rank, and_(rank == last_rank, model.id > last_id)))
+    rows = session.execute(statement.add_columns(rank).order_by(rank, model.id).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor("%r:%d" % (last[-1], last[0]))
+    return [dict(zip(fields, row)) for row in rows[:limit]], next_cursor
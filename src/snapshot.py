@@ -0,0 +1,293 @@
+"""
+In-memory snapshot of the catalog tables (characters, planets), stored by
+column: an array('q') per integer column (NULL_INT stands for null) and a
+list per text column, with repeated values sharing one str. The id column is
+sorted, so a binary search over it is the id -> offset index. No ORM
+instance, dict or tuple is kept per row.
+
+GET /characters, /planets (pages and ?stream=1), the detail endpoints on a
+cache miss and the names in Favorito.serialize read it without touching the
+database. The snapshot is loaded when the app starts (CATALOG_SNAPSHOT=1,
+the default) and, every CATALOG_SNAPSHOT_INTERVAL seconds at most, checked
+against table_version (the table's change counter, versions.py). When the
+counter moved, only the rows whose row_version is above the one the snapshot
+was built at are read and merged. If the counter moved by more than the
+number of rows read (deletes, or a row written twice), the live ids are read
+too so deleted rows are dropped. The detail cache entries (entity_key) of the
+rows a refresh changed or dropped are evicted, so a write from another
+process does not keep an old detail body for CACHE_TTL.
+Commits of this process that touch the catalog force the check on the next
+read; other workers see them within the interval.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from array import array
+import click
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from metrics import Counter, Gauge
+from cache import entity_key
+from database import env_flag
+from utils import decode_cursor, parse_fields, parse_limit, version_statement
+from models import db, Character, Planet
+
+NULL_INT = -2 ** 63
+
+REFRESHES = Counter("catalog_snapshot_refreshes_total", "Catalog snapshot reloads by table and kind", ["table", "kind"])
+
+
+class Columns:
+    """One table of the snapshot. Never modified: a refresh builds a new one."""
+
+    __slots__ = ("model", "fields", "ids", "columns", "version")
+
+    def __init__(self, model, ids, columns, version):
+        self.model = model
+        self.fields = tuple(model.serialize_fields)
+        self.ids = ids
+        self.columns = columns
+        self.version = version
+
+    @classmethod
+    def from_rows(cls, model, rows, version):
+        """Rows are tuples in serialize_fields order, id first."""
+        rows = sorted(rows, key=lambda row: row[0])
+        columns = {}
+        for position, field in enumerate(model.serialize_fields):
+            if model.__table__.c[field].type.python_type is int:
+                columns[field] = array("q", (NULL_INT if row[position] is None else row[position] for row in rows))
+            else:
+                # generos, colores, climas: muchas filas comparten el mismo valor
+                shared = {}
+                columns[field] = [shared.setdefault(row[position], row[position]) for row in rows]
+        return cls(model, columns["id"], columns, version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def offset(self, entity_id):
+        # ids ordenados: la busqueda binaria es el indice id -> posicion, sin un dict por fila
+        offset = bisect.bisect_left(self.ids, entity_id)
+        if offset < len(self.ids) and self.ids[offset] == entity_id:
+            return offset
+        return None
+
+    def row(self, offset, fields):
+        values = [self.columns[field][offset] for field in fields]
+        return tuple(None if value == NULL_INT else value for value in values)
+
+    def rows(self, fields):
+        return (self.row(offset, fields) for offset in range(len(self.ids)))
+
+    def get(self, entity_id):
+        """The serialize() dict of ``entity_id``, or None."""
+        offset = self.offset(entity_id)
+        if offset is None:
+            return None
+        return dict(zip(self.fields, self.row(offset, self.fields)))
+
+    def name(self, entity_id):
+        offset = self.offset(entity_id)
+        return None if offset is None else self.columns["name"][offset]
+
+    def page(self, args, default_limit, max_limit):
+        """Like keyset_statement + execute: (rows, fields, limit), one row more than limit."""
+        limit = parse_limit(args.get("limit"), default_limit, max_limit)
+        fields = parse_fields(self.model, args.get("fields"))
+        after = args.get("after")
+        start = bisect.bisect_right(self.ids, decode_cursor(after)) if after else 0
+        rows = [self.row(offset, fields) for offset in range(start, min(start + limit + 1, len(self.ids)))]
+        return rows, fields, limit
+
+    def merged(self, changed, live_ids, version):
+        """A new Columns with ``changed`` rows applied and rows not in ``live_ids`` dropped."""
+        changed = sorted(changed, key=lambda row: row[0])
+        last = self.ids[-1] if self.ids else None
+        offsets = [self.offset(row[0]) for row in changed]
+        appended = [row for row, offset in zip(changed, offsets) if offset is None]
+        if live_ids is not None or appended and last is not None and appended[0][0] < last:
+            # borrados o ids intercalados: se reconstruye desde las columnas, sin ir a la base
+            changed_ids = set(row[0] for row in changed)
+            rows = changed + [self.row(offset, self.fields) for offset, entity_id in enumerate(self.ids)
+                              if entity_id not in changed_ids and (live_ids is None or entity_id in live_ids)]
+            return Columns.from_rows(self.model, rows, version)
+
+        # lo normal: unas filas editadas y otras nuevas al final; se copian las columnas y se parchean
+        columns = dict((field, column[:]) for field, column in self.columns.items())
+        for row, offset in zip(changed, offsets):
+            for position, field in enumerate(self.fields):
+                value = row[position]
+                if value is None and isinstance(columns[field], array):
+                    value = NULL_INT
+                if offset is None:
+                    columns[field].append(value)
+                else:
+                    columns[field][offset] = value
+        return Columns(self.model, columns["id"], columns, version)
+
+    def footprint(self):
+        """Bytes held by the arrays, the lists and the distinct values in them."""
+        seen = set()
+
+        def size(value):
+            if id(value) in seen:
+                return 0
+            seen.add(id(value))
+            return sys.getsizeof(value)
+
+        total = 0
+        for column in self.columns.values():
+            total += size(column)
+            if isinstance(column, list):
+                total += sum(size(value) for value in column if value is not None)
+        return total
+
+
+def select_rows(connection, model, since=None, until=None):
+    statement = db.select(*[getattr(model, field) for field in model.serialize_fields])
+    if since is not None:
+        # row_version sale del contador de la tabla: no depende del reloj ni de updated_at;
+        # lo escrito despues de leer el contador queda para el siguiente refresco
+        statement = statement.where(model.row_version > since, model.row_version <= until)
+    return [tuple(row) for row in connection.execute(statement)]
+
+
+class CatalogSnapshot:
+
+    def __init__(self, models, interval, caches=()):
+        self.models = models
+        self.interval = interval
+        self.caches = caches
+        self.tables = {}
+        self._checked = 0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def mark_stale(self):
+        self._stale = True
+
+    def due(self):
+        """True when the next table() call goes to the database."""
+        return self._stale or time.monotonic() - self._checked > self.interval
+
+    def table(self, model):
+        """The Columns of ``model``, checked at most every ``interval`` seconds; None if it cannot load."""
+        if self.due():
+            self.refresh()
+        return self.tables.get(model)
+
+    def name(self, model, entity_id):
+        if entity_id is None:
+            return None
+        table = self.table(model)
+        return table.name(entity_id) if table is not None else None
+
+    def refresh(self):
+        with self._lock:
+            if not self._stale and time.monotonic() - self._checked <= self.interval:
+                # otro hilo acaba de refrescar
+                return
+            self._stale = False
+            try:
+                # conexion propia al primario: ni la sesion de la peticion ni una replica
+                with db.engine.connect() as connection:
+                    for model in self.models:
+                        self._refresh_table(connection, model)
+            except SQLAlchemyError:
+                # tablas aun sin crear (flask db upgrade) o base caida: se lee de la base
+                self.tables.clear()
+                self._stale = True
+                return
+            self._checked = time.monotonic()
+
+    def _refresh_table(self, connection, model):
+        version = tuple(connection.execute(version_statement(model)).one())
+        current = self.tables.get(model)
+        if current is not None and current.version == version:
+            return
+        if current is None or current.version[1] is None or version[1] is None or version[1] < current.version[1]:
+            # primera carga, sin contador o base restaurada: se lee todo
+            self.tables[model] = Columns.from_rows(model, select_rows(connection, model), version)
+            if current is not None:
+                self._evict(model, set(current.ids).union(self.tables[model].ids))
+            REFRESHES.inc(table=model.__tablename__, kind="full")
+            return
+        changed = select_rows(connection, model, since=current.version[1], until=version[1])
+        live_ids = None
+        if version[1] - current.version[1] != len(changed):
+            # cada escritura sube el contador en uno: si no cuadra hubo borrados
+            live_ids = set(connection.execute(db.select(model.id)).scalars())
+        self.tables[model] = current.merged(changed, live_ids, version)
+        evicted = set(row[0] for row in changed)
+        if live_ids is not None:
+            evicted.update(entity_id for entity_id in current.ids if entity_id not in live_ids)
+        self._evict(model, evicted)
+        REFRESHES.inc(table=model.__tablename__, kind="incremental")
+
+    def _evict(self, model, entity_ids):
+        # escrituras de otro proceso: el after_commit de este no las vio
+        for entity_id in entity_ids:
+            key = entity_key(model.__tablename__, entity_id)
+            for cache in self.caches:
+                cache.delete(key)
+
+    def stats(self):
+        result = {}
+        for model, table in list(self.tables.items()):
+            footprint = table.footprint()
+            result[model.__tablename__] = {
+                "rows": len(table),
+                "bytes": footprint,
+                "bytes_per_100k_rows": round(footprint * 100000 / len(table)) if len(table) else None,
+            }
+        return result
+
+
+def setup_catalog_snapshot(app, db):
+    app.config.setdefault("CATALOG_SNAPSHOT", env_flag("CATALOG_SNAPSHOT", True))
+    app.config.setdefault("CATALOG_SNAPSHOT_INTERVAL", float(os.getenv("CATALOG_SNAPSHOT_INTERVAL", 1)))
+    if not app.config["CATALOG_SNAPSHOT"]:
+        return None
+
+    snapshot = CatalogSnapshot((Character, Planet), app.config["CATALOG_SNAPSHOT_INTERVAL"],
+                               app.extensions.get("watched_caches", ()))
+    app.extensions["catalog_snapshot"] = snapshot
+    tables = set(model.__tablename__ for model in snapshot.models)
+    # una clave por app: con varias create_app() en el proceso (tests) cada snapshot ve sus commits
+    changed_key = ("catalog_changed", id(app))
+
+    @event.listens_for(db.session, "after_flush")
+    def collect_catalog(session, flush_context):
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if inspect(instance).mapper.local_table.name in tables:
+                session.info[changed_key] = True
+                return
+
+    @event.listens_for(db.session, "do_orm_execute")
+    def collect_catalog_bulk(orm_execute_state):
+        # db.insert(Character) y compania con executemany no pasan por el flush
+        mapper = orm_execute_state.bind_mapper
+        if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+                and mapper is not None and mapper.local_table.name in tables:
+            orm_execute_state.session.info[changed_key] = True
+
+    @event.listens_for(db.session, "after_commit")
+    def refresh_catalog(session):
+        if session.info.pop(changed_key, False):
+            snapshot.mark_stale()
+
+    @event.listens_for(db.session, "after_rollback")
+    def forget_catalog(session):
+        session.info.pop(changed_key, None)
+
+    Gauge("catalog_snapshot_rows", "Rows held by the catalog snapshot", ["table"],
+          callback=lambda: dict(((model.__tablename__,), len(table)) for model, table in list(snapshot.tables.items())))
+
+    # en los comandos de flask (db upgrade, import-catalog) se carga solo si se usa
+    if click.get_current_context(silent=True) is None:
+        with app.app_context():
+            snapshot.refresh()
+    return snapshot
@@ -1,4 +1,8 @@
+import base64
+import hashlib
 from flask import jsonify, url_for
+from sqlalchemy import column, func, select, table
+from encoding import row_encoder
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +19,108 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, parse=int):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return parse(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise APIException("invalid cursor", status_code=400)
+
+def parse_limit(value, default, maximum):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    return min(limit, maximum)
+
+def parse_fields(model, value):
+    # "id" siempre se devuelve, lo necesitamos para el cursor
+    if not value:
+        return list(model.serialize_fields)
+    fields = ["id"]
+    for field in value.split(","):
+        field = field.strip()
+        if field == "" or field in fields:
+            continue
+        if field not in model.serialize_fields:
+            raise APIException("unknown field: " + field, status_code=400)
+        fields.append(field)
+    return fields
+
+def keyset_statement(model, args, default_limit=100, max_limit=1000):
+    """
+    SELECT for one page of ``model`` ordered by primary key, with only the
+    requested columns. Returns (statement, fields, limit).
+    """
+    limit = parse_limit(args.get("limit"), default_limit, max_limit)
+    fields = parse_fields(model, args.get("fields"))
+
+    statement = select(*[getattr(model, field) for field in fields])
+    after = args.get("after")
+    if after:
+        statement = statement.where(model.id > decode_cursor(after))
+    # pedimos una fila de mas para saber si hay pagina siguiente
+    return statement.order_by(model.id).limit(limit + 1), fields, limit
+
+def keyset_trim(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0])
+
+    return rows, next_cursor
+
+def keyset_results(rows, fields, limit):
+    rows, next_cursor = keyset_trim(rows, limit)
+    return [dict(zip(fields, row)) for row in rows], next_cursor
+
+def wants_stream(request):
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
+
+def stream_rows(session, model, args, batch_size=500):
+    """
+    Generator of NDJSON lines for every row of ``model``. Uses a server side
+    cursor (yield_per) so memory does not grow with the table.
+    """
+    fields = parse_fields(model, args.get("fields"))
+    query = session.query(*[getattr(model, field) for field in fields]) \
+        .order_by(model.id) \
+        .execution_options(yield_per=batch_size)
+    encode = row_encoder(model, fields)
+    for row in query:
+        yield encode(row) + "\n"
+
+def make_etag(*parts):
+    return hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+
+TABLE_VERSIONS = table("table_versions", column("name"), column("version"))
+
+def version_statement(model, *criteria):
+    # contador de cambios de la tabla (versions.py): cambia con cualquier escritura,
+    # aunque deje updated_at y count como estaban
+    counter = select(TABLE_VERSIONS.c.version).where(TABLE_VERSIONS.c.name == model.__tablename__).scalar_subquery()
+    statement = select(func.max(model.updated_at), counter)
+    if criteria:
+        statement = statement.where(*criteria)
+    return statement
+
+def table_version(session, model, *criteria):
+    """
+    (last_modified, version) of ``model`` without loading any row: the
+    newest updated_at and the table's change counter, which goes up on every
+    insert, update and delete.
+    """
+    return tuple(session.execute(version_statement(model, *criteria)).one())
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -0,0 +1,76 @@
+"""
+Change counters for the catalog tables. table_versions holds one row per
+table, and its version goes up on every INSERT, UPDATE and DELETE of that
+table. Every inserted or updated row is stamped with the new value in its
+row_version column. Triggers in the database do both, so writes from
+Flask-Admin, import-catalog (COPY), other workers or plain SQL are all
+counted.
+
+The list ETags compare the counter instead of (max(updated_at), count).
+That pair misses an edit that keeps an older updated_at, or a delete
+followed by an insert. The catalog snapshot re-reads only the rows whose
+row_version is above the counter it last saw.
+
+- SQLite: AFTER INSERT/UPDATE/DELETE triggers per row. Writers are
+  serialized, so stamps follow commit order.
+- Postgres: a BEFORE INSERT OR UPDATE trigger per row bumps the counter and
+  stamps NEW.row_version. A statement-level trigger bumps it on DELETE.
+  The counter row stays locked until commit, so stamps follow commit order
+  here too.
+"""
+from sqlalchemy import DDL, event
+
+COUNTER_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN "
+    "UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql"
+)
+STAMP_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS trigger AS $$ BEGIN "
+    "UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME "
+    "RETURNING version INTO NEW.row_version; "
+    "RETURN NEW; END $$ LANGUAGE plpgsql"
+)
+
+
+def counter_row(name):
+    return ("INSERT INTO table_versions (name, version) SELECT '%s', 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM table_versions WHERE name = '%s')" % (name, name))
+
+
+def sqlite_triggers(name):
+    bump = "UPDATE table_versions SET version = version + 1 WHERE name = '%s';" % name
+    stamp = bump + (" UPDATE %s SET row_version = (SELECT version FROM table_versions WHERE name = '%s')"
+                    " WHERE id = new.id;" % (name, name))
+    # el UPDATE de row_version que hace _ai no debe contar como otra escritura en _au
+    # (_au no se dispara a si mismo: recursive_triggers esta apagado)
+    return [
+        "CREATE TRIGGER IF NOT EXISTS %s_version_ai AFTER INSERT ON %s BEGIN %s END" % (name, name, stamp),
+        "CREATE TRIGGER IF NOT EXISTS %s_version_au AFTER UPDATE ON %s "
+        "WHEN new.row_version = old.row_version BEGIN %s END" % (name, name, stamp),
+        "CREATE TRIGGER IF NOT EXISTS %s_version_ad AFTER DELETE ON %s BEGIN %s END" % (name, name, bump),
+    ]
+
+
+def postgresql_triggers(name):
+    return [
+        COUNTER_FUNCTION,
+        STAMP_FUNCTION,
+        "DROP TRIGGER IF EXISTS %s_version ON %s" % (name, name),
+        "CREATE TRIGGER %s_version AFTER DELETE ON %s "
+        "FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()" % (name, name),
+        "DROP TRIGGER IF EXISTS %s_row_version ON %s" % (name, name),
+        "CREATE TRIGGER %s_row_version BEFORE INSERT OR UPDATE ON %s "
+        "FOR EACH ROW EXECUTE PROCEDURE stamp_row_version()" % (name, name),
+    ]
+
+
+def register_version_ddl(metadata, *models):
+    """Creates the counters and triggers after db.create_all() has created every table."""
+    for model in models:
+        name = model.__tablename__
+        event.listen(metadata, "after_create", DDL(counter_row(name)))
+        for statement in sqlite_triggers(name):
+            event.listen(metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+        for statement in postgresql_triggers(name):
+            event.listen(metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
@@ -0,0 +1,211 @@
+"""
+Optional write-behind for POST/DELETE /users/<id>/favoritos/
+(FAVORITOS_WRITE_BEHIND=1).
+
+Instead of one transaction per request, the change is validated, queued in
+memory and answered with 202. A background thread writes whatever is queued
+in a single transaction every FAVORITOS_FLUSH_MS milliseconds, or as soon as
+FAVORITOS_FLUSH_ITEMS changes are waiting.
+
+Changes are coalesced per favorite (a character, or a planet-only favorite,
+of a user, the same key as the unique indexes): each queued change says
+"present" or "absent", so an add followed by a delete of a favorite that did
+not exist cancels out and is never written.
+
+Reading a user's favorites (in app.py and in asgi.py) and the batch
+endpoints first flush that user's queued changes, so readers never see the
+table behind the queue. The
+queue is flushed on graceful shutdown (atexit, which gunicorn runs on
+SIGTERM); changes still queued when a worker is killed are lost.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from database import env_flag
+from metrics import Counter, Gauge
+from models import db, Character, Planet, Favorito, User
+
+logger = logging.getLogger(__name__)
+
+QUEUED = Counter("favoritos_write_behind_queued_total", "Favorite changes accepted into the write-behind queue")
+CANCELLED = Counter("favoritos_write_behind_cancelled_total", "Queued changes cancelled by a later opposite change")
+FLUSHED = Counter("favoritos_write_behind_flushed_total", "Favorite changes written by the write-behind thread")
+COMMITS = Counter("favoritos_write_behind_commits_total", "Transactions committed by the write-behind thread")
+DROPPED = Counter("favoritos_write_behind_dropped_total", "Queued changes that failed to write and were dropped")
+
+
+def favorito_key(user_id, characters_id, planets_id):
+    # la misma identidad que los indices unicos de favoritos
+    return (user_id,) + Favorito.identity(characters_id, planets_id)
+
+
+def stored(key):
+    user_id, characters_id, planets_id = key
+    query = db.session.query(Favorito.id).filter(Favorito.user_id == user_id)
+    if characters_id is not None:
+        query = query.filter(Favorito.characters_id == characters_id)
+    else:
+        query = query.filter(Favorito.characters_id.is_(None), Favorito.planets_id == planets_id)
+    return query.first() is not None
+
+
+class FavoritosWriteBehind:
+
+    def __init__(self, app, interval, max_items):
+        self.app = app
+        self.interval = interval
+        self.max_items = max_items
+        # clave -> (present, characters_id, planets_id); pending recibe, in_flight se esta escribiendo
+        self.pending = {}
+        self.in_flight = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flushed = threading.Condition(self._lock)
+        self._closed = False
+        # sube cada vez que termina un flush: la tabla leida antes puede no ser la de ahora
+        self._generation = 0
+        self._thread = threading.Thread(target=self._run, name="favoritos-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def change(self, user_id, characters_id, planets_id, present):
+        """
+        Queues adding (present=True) or deleting a favorite. Returns "queued",
+        "exists" (already there, for adds), "not_found" (for deletes),
+        "user_not_found" (for adds) or "invalid" (unknown character or planet).
+        """
+        if not Favorito.valid_pair((characters_id, planets_id)):
+            # bulk_add lo descartaria en el flush, despues de haber respondido 202
+            return "invalid"
+        if present:
+            # si no, el flush fallaria por la FK y el cambio se perderia despues del 202
+            if db.session.get(User, user_id) is None:
+                return "user_not_found"
+            if characters_id is None and planets_id is None \
+                    or characters_id is not None and db.session.get(Character, characters_id) is None \
+                    or planets_id is not None and db.session.get(Planet, planets_id) is None:
+                return "invalid"
+        key = favorito_key(user_id, characters_id, planets_id)
+
+        while True:
+            with self._lock:
+                generation = self._generation
+            in_table = stored(key)
+
+            with self._lock:
+                if self._generation != generation:
+                    # un flush termino entre la consulta y el lock: se vuelve a leer la tabla
+                    continue
+                below = self.in_flight[key][0] if key in self.in_flight else in_table
+                current = self.pending[key][0] if key in self.pending else below
+                if current == present:
+                    return "exists" if present else "not_found"
+                if below == present:
+                    # vuelve a lo que ya hay (o habra) en la tabla: no hay nada que escribir
+                    del self.pending[key]
+                    CANCELLED.inc()
+                else:
+                    self.pending[key] = (present, characters_id, planets_id)
+                    QUEUED.inc()
+                if len(self.pending) >= self.max_items:
+                    self._wakeup.notify()
+                return "queued"
+
+    def wait_for_user(self, user_id, timeout=5):
+        """
+        Flushes now and waits until no change of ``user_id`` is queued.
+        Returns True when there was something to wait for.
+        """
+        deadline = time.monotonic() + timeout
+        waited = False
+        with self._lock:
+            while any(key[0] == user_id for layer in (self.pending, self.in_flight) for key in layer):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    break
+                waited = True
+                self._wakeup.notify()
+                self._flushed.wait(remaining)
+        return waited
+
+    def _run(self):
+        while True:
+            with self._lock:
+                # cada intervalo, o antes si el lote se llena o alguien tiene que leer
+                if len(self.pending) < self.max_items and not self._closed:
+                    self._wakeup.wait(self.interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self.pending:
+                return 0
+            self.in_flight, self.pending = self.pending, {}
+            batch = self.in_flight
+
+        by_user = {}
+        for (user_id, _, _), (present, characters_id, planets_id) in batch.items():
+            items = by_user.setdefault(user_id, ([], []))
+            items[0 if present else 1].append({"characters_id": characters_id, "planets_id": planets_id})
+
+        dropped = 0
+        with self.app.app_context():
+            try:
+                self._write(by_user)
+            except Exception:
+                db.session.rollback()
+                logger.exception("write-behind flush failed, retrying user by user")
+                for user_id, items in by_user.items():
+                    try:
+                        self._write({user_id: items})
+                    except Exception:
+                        db.session.rollback()
+                        dropped += len(items[0]) + len(items[1])
+                        logger.exception("dropping queued favoritos of user %s", user_id)
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self.in_flight = {}
+            self._generation += 1
+            self._flushed.notify_all()
+        FLUSHED.inc(len(batch) - dropped)
+        DROPPED.inc(dropped)
+        return len(batch) - dropped
+
+    def _write(self, by_user):
+        for user_id, (adds, deletes) in by_user.items():
+            if deletes:
+                Favorito.bulk_delete(user_id, deletes)
+            if adds:
+                Favorito.bulk_add(user_id, adds)
+        db.session.commit()
+        COMMITS.inc()
+
+    def close(self):
+        """Stops the thread after writing everything still queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join(timeout=30)
+        self.flush()
+
+
+def setup_write_behind(app):
+    app.config.setdefault("FAVORITOS_WRITE_BEHIND", env_flag("FAVORITOS_WRITE_BEHIND", False))
+    app.config.setdefault("FAVORITOS_FLUSH_MS", int(os.getenv("FAVORITOS_FLUSH_MS", 50)))
+    app.config.setdefault("FAVORITOS_FLUSH_ITEMS", int(os.getenv("FAVORITOS_FLUSH_ITEMS", 500)))
+    if not app.config["FAVORITOS_WRITE_BEHIND"]:
+        return None
+
+    queue = FavoritosWriteBehind(app, app.config["FAVORITOS_FLUSH_MS"] / 1000.0, app.config["FAVORITOS_FLUSH_ITEMS"])
+    app.extensions["favoritos_write_behind"] = queue
+    Gauge("favoritos_write_behind_pending", "Favorite changes waiting to be written",
+          callback=lambda: len(queue.pending) + len(queue.in_flight))
+    return queue
@@ -0,0 +1,82 @@
+"""
+Shared fixtures.
+
+app.py builds an app when it is imported, so it is imported inside a fixture
+with DATABASE_URL pointing at a throwaway file, and the variable is restored
+right after. Each test then gets its own app from create_app() on its own
+SQLite file, with the rate limiter off.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture(scope="session")
+def create_app(tmp_path_factory):
+    saved = os.environ.get("DATABASE_URL")
+    os.environ["DATABASE_URL"] = "sqlite:///%s" % (tmp_path_factory.mktemp("import") / "import.db")
+    try:
+        from app import create_app
+    finally:
+        if saved is None:
+            del os.environ["DATABASE_URL"]
+        else:
+            os.environ["DATABASE_URL"] = saved
+    return create_app
+
+
+@pytest.fixture
+def make_app(create_app, tmp_path):
+    from models import db
+    apps = []
+
+    def make(**config):
+        config.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite:///%s" % (tmp_path / ("app%d.db" % len(apps))))
+        config.setdefault("RATELIMIT_ENABLED", False)
+        app = create_app(config)
+        with app.app_context():
+            # solo el primario: los binds de las replicas de otra app siguen en db.metadatas
+            db.create_all(bind_key=None)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        queue = app.extensions.get("favoritos_write_behind")
+        if queue is not None:
+            queue.close()
+        with app.app_context():
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def catalog(create_app):
+    """Adds ``count`` characters, planets and users to ``app``; returns the ids of each."""
+    from models import db, Character, Planet, User
+
+    def add(app, count=5):
+        with app.app_context():
+            rows = {"characters": [Character(name="Character %d" % index, gender="female" if index % 2 else "male")
+                                   for index in range(count)],
+                    "planets": [Planet(name="Planet %d" % index) for index in range(count)],
+                    "users": [User(email="user%d@example.com" % index, password="x", is_active=True)
+                              for index in range(count)]}
+            for instances in rows.values():
+                db.session.add_all(instances)
+            db.session.commit()
+            return dict((table, [instance.id for instance in instances]) for table, instances in rows.items())
+
+    return add
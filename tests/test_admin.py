@@ -0,0 +1,31 @@
+"""
+Flask-Admin, built at startup (ADMIN=on) or on the first /admin request
+(ADMIN=lazy): its writes go through the API's engine and evict its caches.
+"""
+import pytest
+
+
+@pytest.mark.parametrize("mode", ["on", "lazy"])
+def test_edit_is_seen_by_the_api(make_app, catalog, mode):
+    app = make_app(ADMIN=mode, CATALOG_SNAPSHOT=False)
+    catalog(app, 2)
+    client = app.test_client()
+    assert client.get("/characters/1").get_json()["results"]["name"] == "Character 0"
+
+    response = client.post("/admin/character/edit/?id=1", data={"name": "Renamed", "gender": "female"})
+
+    assert response.status_code == 302
+    assert client.get("/characters/1").get_json()["results"]["name"] == "Renamed"
+
+
+@pytest.mark.parametrize("mode", ["on", "lazy"])
+def test_unique_columns_are_validated(make_app, catalog, mode):
+    app = make_app(ADMIN=mode)
+    catalog(app, 2)
+    client = app.test_client()
+
+    assert client.get("/admin/user/new/").status_code == 200
+    response = client.post("/admin/user/new/", data={"email": "user0@example.com", "password": "x"})
+
+    assert response.status_code == 200
+    assert b"Already exists" in response.data
@@ -0,0 +1,97 @@
+"""
+asgi.py: the async read routes answer like the Flask views they replace.
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+
+def call(application, path, query="", headers=()):
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+             "headers": [(name.lower().encode(), value.encode()) for name, value in headers]}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await application(scope, receive, send)
+        for engine in [application.engine] + application.replica_engines:
+            await engine.dispose()
+
+    asyncio.run(run())
+    start = messages[0]
+    return start["status"], dict((name.decode(), value.decode()) for name, value in start["headers"]), messages[1]["body"]
+
+
+@pytest.fixture
+def async_app(create_app):
+    from asgi import AsyncReadApp
+    return AsyncReadApp
+
+
+def names(body):
+    import json
+    return [item["name"] for item in json.loads(body)["results"]]
+
+
+def test_lists_come_from_the_snapshot(make_app, catalog, async_app, monkeypatch):
+    app = make_app(SERVER_TIMING=True)
+    catalog(app, 3)
+    application = async_app(app)
+    call(application, "/characters")
+
+    # ya cargado: sin consultas a la base
+    monkeypatch.setattr(application.snapshot, "interval", 3600)
+    status, headers, body = call(application, "/characters", "limit=2")
+
+    assert status == 200
+    assert names(body) == ["Character 0", "Character 1"]
+    assert '"0 queries"' in headers["server-timing"]
+    assert headers["etag"] == app.test_client().get("/characters?limit=2").headers["ETag"]
+
+
+def test_reads_go_to_the_replica(make_app, catalog, async_app, tmp_path):
+    primary, replica = str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+    app = make_app(SQLALCHEMY_DATABASE_URI="sqlite:///" + primary, DATABASE_REPLICA_URLS="sqlite:///" + replica,
+                   CATALOG_SNAPSHOT=False)
+    catalog(app, 2)
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+        source.backup(target)
+    with sqlite3.connect(primary) as source:
+        source.execute("UPDATE characters SET name = 'Renamed' WHERE id = 1")
+    app.extensions["replicas"].max_lag = float("inf")
+    application = async_app(app)
+
+    assert names(call(application, "/characters")[2])[0] == "Character 0"
+    pinned = "db_primary_until=%d" % 2 ** 40
+    assert names(call(application, "/characters", headers=[("Cookie", pinned)])[2])[0] == "Renamed"
+
+
+@pytest.mark.parametrize("origins, origin, allowed", [
+    (["*"], "https://a.example.com", "https://a.example.com"),
+    (["https://a.example.com"], "https://b.example.com", None),
+])
+def test_cors_headers_match_flask(make_app, async_app, origins, origin, allowed):
+    app = make_app(CORS_ORIGINS=origins)
+    application = async_app(app)
+
+    status, headers, _ = call(application, "/planets", headers=[("Origin", origin)])
+
+    assert status == 200
+    assert headers.get("access-control-allow-origin") == allowed
+    flask_headers = app.test_client().get("/planets", headers={"Origin": origin}).headers
+    assert flask_headers.get("Access-Control-Allow-Origin") == allowed
+
+
+def test_weak_etag_is_not_modified(make_app, catalog, async_app):
+    app = make_app()
+    catalog(app, 1)
+    application = async_app(app)
+    etag = call(application, "/planets")[1]["etag"]
+
+    assert call(application, "/planets", headers=[("If-None-Match", "W/" + etag)])[0] == 304
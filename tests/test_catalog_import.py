@@ -0,0 +1,46 @@
+"""
+flask import-catalog: rows matched by name, only the columns in the file written.
+"""
+import io
+
+
+def run_import(app, table, text, fmt):
+    from catalog_import import MODELS, import_catalog
+    with app.app_context():
+        return import_catalog(MODELS[table], io.StringIO(text), fmt)
+
+
+def planet(app, name):
+    from models import db, Planet
+    with app.app_context():
+        return db.session.execute(db.select(Planet).where(Planet.name == name)).scalar_one().serialize()
+
+
+def test_columns_missing_from_the_csv_keep_their_values(app):
+    run_import(app, "planets", "name,climate,population\nTatooine,arid,200000\n", "csv")
+
+    summary = run_import(app, "planets", "name,population\nTatooine,unknown\nHoth,\n", "csv")
+
+    assert (summary["inserted"], summary["updated"]) == (1, 1)
+    assert planet(app, "Tatooine")["climate"] == "arid"
+    assert planet(app, "Tatooine")["population"] is None
+    assert planet(app, "Hoth")["climate"] is None
+
+
+def test_json_lines_update_only_their_own_keys(app):
+    run_import(app, "planets", '{"name": "Tatooine", "climate": "arid", "population": 200000}\n', "jsonl")
+
+    summary = run_import(app, "planets", '{"name": "Tatooine", "climate": "hot"}\n'
+                                         '{"name": "Tatooine", "diameter": "10465"}\n', "jsonl")
+
+    tatooine = planet(app, "Tatooine")
+    assert summary["updated"] == 1
+    assert (tatooine["climate"], tatooine["population"], tatooine["diameter"]) == ("hot", 200000, 10465)
+
+
+def test_reimporting_a_partial_file_changes_nothing(app):
+    run_import(app, "planets", "name,climate\nTatooine,arid\n", "csv")
+
+    summary = run_import(app, "planets", "name,climate\nTatooine,arid\n", "csv")
+
+    assert (summary["inserted"], summary["updated"], summary["unchanged"]) == (0, 0, 1)
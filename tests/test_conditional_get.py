@@ -0,0 +1,66 @@
+"""
+ETag / If-None-Match on the list and detail endpoints: 304 while nothing
+changed, a new ETag after any write, including one that keeps updated_at.
+"""
+import pytest
+from sqlalchemy import text
+
+
+def rename(app, table, entity_id, name):
+    # SQL directo, como otro worker o un script: updated_at queda como estaba
+    from models import db
+    with app.app_context():
+        db.session.execute(text("UPDATE %s SET name = :name WHERE id = :id" % table), {"name": name, "id": entity_id})
+        db.session.commit()
+
+
+@pytest.mark.parametrize("snapshot", [True, False], ids=["snapshot", "database"])
+def test_list_is_304_until_a_row_changes(make_app, catalog, snapshot):
+    app = make_app(CATALOG_SNAPSHOT=snapshot, CATALOG_SNAPSHOT_INTERVAL=0)
+    catalog(app, 3)
+    client = app.test_client()
+
+    first = client.get("/characters?limit=2")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.last_modified is not None
+
+    repeated = client.get("/characters?limit=2", headers={"If-None-Match": etag})
+    assert repeated.status_code == 304 and repeated.data == b""
+    # la respuesta comprimida lleva la ETag debil
+    assert client.get("/characters?limit=2", headers={"If-None-Match": "W/" + etag}).status_code == 304
+
+    rename(app, "characters", 2, "Renamed")
+    changed = client.get("/characters?limit=2", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["results"][1]["name"] == "Renamed"
+
+
+def test_list_etag_depends_on_the_query(app, client, catalog):
+    catalog(app, 3)
+
+    assert client.get("/planets?limit=1").headers["ETag"] != client.get("/planets?limit=2").headers["ETag"]
+
+
+@pytest.mark.parametrize("snapshot", [True, False], ids=["snapshot", "database"])
+def test_detail_is_304_until_the_row_changes(make_app, catalog, snapshot):
+    app = make_app(CATALOG_SNAPSHOT=snapshot, CATALOG_SNAPSHOT_INTERVAL=0)
+    catalog(app, 2)
+    client = app.test_client()
+
+    etag = client.get("/planets/1").headers["ETag"]
+    assert client.get("/planets/1", headers={"If-None-Match": etag}).status_code == 304
+
+    from models import db, Planet
+    with app.app_context():
+        db.session.get(Planet, 1).name = "Renamed"
+        db.session.commit()
+    changed = client.get("/planets/1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["results"]["name"] == "Renamed"
+
+
+def test_missing_detail_is_404(app, client, catalog):
+    catalog(app, 1)
+
+    assert client.get("/characters/99").status_code == 404
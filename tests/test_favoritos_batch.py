@@ -0,0 +1,93 @@
+"""
+POST and DELETE /users/<id>/favoritos/batch: one outcome per item, in one
+transaction.
+"""
+from sqlalchemy import event, text
+
+
+def results(response):
+    return [item["result"] for item in response.get_json()["results"]]
+
+
+def test_add_reports_each_item(app, client, catalog):
+    catalog(app, 3)
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    response = client.post("/users/1/favoritos/batch", json=[
+        {"characters_id": 1, "planets_id": None},
+        {"characters_id": 2, "planets_id": 1},
+        {"characters_id": 2, "planets_id": 3},
+        {"characters_id": None, "planets_id": 2},
+        {"characters_id": 99, "planets_id": None},
+        {"characters_id": None, "planets_id": None},
+    ])
+
+    assert response.status_code == 200
+    assert results(response) == ["exists", "created", "duplicate", "created", "invalid", "invalid"]
+    favoritos = client.get("/users/1/favoritos?all=true").get_json()["results"]
+    assert set((item["characters"], item["planets"]) for item in favoritos) == {
+        ("Character 0", None), ("Character 1", "Planet 0"), (None, "Planet 1")}
+
+
+def test_ids_that_are_not_integers_are_invalid(app, client, catalog):
+    catalog(app, 1)
+
+    response = client.post("/users/1/favoritos/batch", json=[
+        {"characters_id": [1], "planets_id": None},
+        {"characters_id": "1", "planets_id": None},
+        {"characters_id": True, "planets_id": None},
+        {"characters_id": None, "planets_id": 2 ** 40},
+    ])
+
+    assert response.status_code == 200
+    assert results(response) == ["invalid"] * 4
+
+
+def test_row_inserted_concurrently_is_reported_as_exists(app, client, catalog):
+    from models import db
+    catalog(app, 2)
+
+    inserted = []
+
+    def other_request_wins(conn, cursor, statement, parameters, context, executemany):
+        # otra peticion inserta el mismo favorito entre la lectura y el INSERT del lote
+        if statement.startswith("INSERT INTO favoritos") and not inserted:
+            inserted.append(True)
+            cursor.execute("INSERT INTO favoritos (user_id, characters_id, updated_at) VALUES (1, 2, '2020-01-01')")
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", other_request_wins)
+
+    response = client.post("/users/1/favoritos/batch", json=[{"characters_id": 1, "planets_id": None},
+                                                            {"characters_id": 2, "planets_id": None}])
+    event.remove(engine, "before_cursor_execute", other_request_wins)
+
+    assert response.status_code == 200
+    assert results(response) == ["created", "exists"]
+    with app.app_context():
+        assert db.session.execute(text("SELECT count(*) FROM favoritos")).scalar() == 2
+
+
+def test_delete_reports_each_item(app, client, catalog):
+    catalog(app, 2)
+    client.post("/users/1/favoritos/batch", json=[{"characters_id": 1, "planets_id": None},
+                                                 {"characters_id": None, "planets_id": 2}])
+
+    response = client.delete("/users/1/favoritos/batch", json=[
+        {"characters_id": 1, "planets_id": None},
+        {"characters_id": None, "planets_id": 2},
+        {"characters_id": 2, "planets_id": None},
+        {"characters_id": "1", "planets_id": None},
+    ])
+
+    assert results(response) == ["deleted", "deleted", "not_found", "invalid"]
+    assert client.get("/users/1/favoritos?all=true").get_json()["results"] == []
+
+
+def test_unknown_user_is_404_and_bad_body_is_400(app, client, catalog):
+    catalog(app, 1)
+
+    assert client.post("/users/9/favoritos/batch", json=[{"characters_id": 1, "planets_id": None}]).status_code == 404
+    assert client.post("/users/1/favoritos/batch", json={"characters_id": 1}).status_code == 400
+    assert client.post("/users/1/favoritos/batch", json=[1, 2]).status_code == 400
@@ -0,0 +1,63 @@
+"""
+Query plan check for the favoritos table.
+
+    $ python -m pytest tests/
+
+Calls every favorites endpoint of src/app.py against a throwaway SQLite
+database, records the SQL they run and checks with EXPLAIN QUERY PLAN that
+no statement on favoritos scans the whole table and that the ones filtering
+by user_id use one of the user_id indexes.
+"""
+import re
+
+import pytest
+from sqlalchemy import event
+
+USER_ID_INDEXES = ("ix_favoritos_user_id_characters_id", "ix_favoritos_user_id_planets_id",
+                   "uq_favoritos_user_id_planets_id")
+# la tabla favoritos, no user_favoritos ni la columna user_favoritos.favoritos
+FAVORITOS_TABLE = re.compile(r"(?<![\w.])favoritos\b")
+
+
+@pytest.fixture
+def favoritos_statements(app, catalog):
+    from models import db
+    catalog(app, 1)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if FAVORITOS_TABLE.search(statement) and not statement.lstrip().upper().startswith("EXPLAIN"):
+            statements.append((statement, parameters if not executemany else parameters[0]))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    client = app.test_client()
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+    client.get("/users/1/favoritos")
+    client.get("/users/1/favoritos?all=true")
+    client.post("/users/1/favoritos/batch", json=[{"characters_id": None, "planets_id": 1}])
+    client.delete("/users/1/favoritos/", json={"characters_id": None, "planets_id": 1})
+    client.delete("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+    client.delete("/users/1/favoritos/batch", json=[{"characters_id": 1, "planets_id": None}])
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    # los INSERT no tienen plan que mirar
+    return [(statement, parameters) for statement, parameters in statements
+            if not statement.lstrip().upper().startswith("INSERT")]
+
+
+def test_favoritos_statements_use_user_id_index(app, favoritos_statements):
+    from models import db
+    assert favoritos_statements
+
+    for statement, parameters in favoritos_statements:
+        with app.app_context():
+            plan = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        details = [row[-1] for row in plan if FAVORITOS_TABLE.search(row[-1])]
+
+        assert details, (statement, plan)
+        for detail in details:
+            # "SCAN favoritos" sin indice = recorrido completo de la tabla
+            assert not (detail.startswith("SCAN favoritos") and "INDEX" not in detail), (statement, detail)
+        if "favoritos.user_id = " in statement:
+            assert any(index in detail for detail in details for index in USER_ID_INDEXES), (statement, details)
@@ -0,0 +1,73 @@
+"""
+Idempotency-Key on the POST endpoints: a retry replays the stored response
+instead of running the view again.
+"""
+import pytest
+
+
+def new_user(client, key, email="new@example.com"):
+    return client.post("/users", json={"email": email, "password": "secret", "is_active": True},
+                       headers={"Idempotency-Key": key})
+
+
+def user_count(client):
+    return len(client.get("/users?limit=1000").get_json()["results"])
+
+
+def test_retry_replays_the_first_response(client):
+    first = new_user(client, "key-1")
+    retry = new_user(client, "key-1")
+
+    assert retry.status_code == first.status_code
+    assert retry.data == first.data
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert user_count(client) == 1
+
+
+def test_replay_survives_the_in_process_cache(app, client):
+    # otro worker: solo tiene la tabla idempotency_keys
+    first = new_user(client, "key-1")
+    app.extensions["idempotency"].memory.clear()
+
+    retry = new_user(client, "key-1")
+
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.data == first.data
+
+
+def test_same_key_with_another_body_is_422(client):
+    new_user(client, "key-1")
+
+    assert new_user(client, "key-1", email="other@example.com").status_code == 422
+    assert user_count(client) == 1
+
+
+def test_same_key_on_another_endpoint_runs(app, client, catalog):
+    catalog(app, 1)
+    new_user(client, "key-1")
+
+    response = client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None},
+                           headers={"Idempotency-Key": "key-1"})
+
+    assert "Idempotent-Replayed" not in response.headers
+
+
+def test_key_in_progress_is_409(app, client):
+    from idempotency import idempotency_key
+    with app.test_request_context("/users", method="POST"):
+        app.extensions["idempotency"].start(idempotency_key("key-1"))
+
+    assert new_user(client, "key-1").status_code == 409
+
+
+@pytest.mark.parametrize("key", ["", "x" * 256])
+def test_bad_key_is_400(client, key):
+    assert new_user(client, key).status_code == 400
+
+
+def test_without_key_every_post_runs(client):
+    client.post("/users", json={"email": "a@example.com", "password": "secret", "is_active": True})
+    client.post("/users", json={"email": "b@example.com", "password": "secret", "is_active": True})
+
+    assert user_count(client) == 2
@@ -0,0 +1,54 @@
+"""
+Keyset (cursor) pagination and field projection of the list endpoints, read
+from the catalog snapshot and from the database.
+"""
+from urllib.parse import urlsplit
+
+import pytest
+
+
+def walk(client, url):
+    pages = []
+    while url:
+        body = client.get(url).get_json()
+        pages.append(body["results"])
+        url = body["next"]
+        if url:
+            parts = urlsplit(url)
+            url = parts.path + "?" + parts.query
+    return pages
+
+
+@pytest.mark.parametrize("snapshot", [True, False], ids=["snapshot", "database"])
+@pytest.mark.parametrize("path, table", [("/characters", "characters"), ("/planets", "planets"), ("/users", "users")])
+def test_pages_cover_every_row_once_in_id_order(make_app, catalog, snapshot, path, table):
+    app = make_app(CATALOG_SNAPSHOT=snapshot)
+    ids = catalog(app, 7)[table]
+
+    pages = walk(app.test_client(), path + "?limit=3")
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [row["id"] for page in pages for row in page] == ids
+
+
+@pytest.mark.parametrize("snapshot", [True, False], ids=["snapshot", "database"])
+def test_fields_projects_columns_and_keeps_id(make_app, catalog, snapshot):
+    app = make_app(CATALOG_SNAPSHOT=snapshot)
+    catalog(app, 3)
+
+    results = app.test_client().get("/characters?fields=name&limit=2").get_json()["results"]
+
+    assert results == [{"id": 1, "name": "Character 0"}, {"id": 2, "name": "Character 1"}]
+
+
+def test_last_page_has_no_next(app, client, catalog):
+    catalog(app, 2)
+
+    assert client.get("/characters?limit=2").get_json()["next"] is None
+
+
+@pytest.mark.parametrize("query", ["after=not-a-cursor", "limit=0", "limit=ten", "fields=password"])
+def test_bad_arguments_are_400(app, client, catalog, query):
+    catalog(app, 2)
+
+    assert client.get("/users?" + query).status_code == 400
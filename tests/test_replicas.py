@@ -0,0 +1,80 @@
+"""
+Read-replica routing on two SQLite files.
+
+One file is the primary, a copy made with the SQLite backup API is the
+replica (DATABASE_REPLICA_URLS); "replication" is copying it again.
+"""
+import sqlite3
+
+import pytest
+
+
+def replicate(primary, replica):
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def replica_lag(client):
+    for line in client.get("/metrics").get_data(as_text=True).splitlines():
+        if line.startswith('db_replica_lag_seconds{replica="0"}'):
+            return float(line.split()[-1])
+    return None
+
+
+def emails(client):
+    return [user["email"] for user in client.get("/users?limit=1000").get_json()["results"]]
+
+
+@pytest.fixture
+def files(tmp_path):
+    return str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+
+
+@pytest.fixture
+def replicated_app(make_app, catalog, files):
+    primary, replica = files
+    # sin la copia en memoria del catalogo: los detalles se leen de la base
+    app = make_app(SQLALCHEMY_DATABASE_URI="sqlite:///" + primary, DATABASE_REPLICA_URLS="sqlite:///" + replica,
+                   CATALOG_SNAPSHOT=False, SERVER_TIMING=True)
+    catalog(app, 3)
+    replicate(primary, replica)
+    app.extensions["replicas"].lag_interval = 0
+    return app
+
+
+def test_writer_reads_its_writes_and_others_read_the_replica(replicated_app):
+    writer, reader = replicated_app.test_client(), replicated_app.test_client()
+
+    writer.put("/users/1", json={"email": "changed@example.com"})
+
+    assert "changed@example.com" in emails(writer)
+    assert "changed@example.com" not in emails(reader)
+
+
+def test_detail_cache_is_filled_from_the_primary(replicated_app, files):
+    reader = replicated_app.test_client()
+    with sqlite3.connect(files[0]) as primary:
+        primary.execute("UPDATE characters SET name = 'Renamed' WHERE id = 1")
+
+    assert reader.get("/characters/1").get_json()["results"]["name"] == "Renamed"
+
+
+def test_replica_queries_count_in_server_timing(replicated_app):
+    timing = replicated_app.test_client().get("/users?limit=1000").headers["Server-Timing"]
+
+    assert "queries" in timing and '"0 queries"' not in timing
+
+
+def test_lag_is_reported_until_the_replica_catches_up(replicated_app, files):
+    writer, reader = replicated_app.test_client(), replicated_app.test_client()
+    writer.put("/users/1", json={"email": "changed@example.com"})
+    writer.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    assert replica_lag(reader) > 0
+
+    replicate(*files)
+    assert replica_lag(reader) == 0
+    assert "changed@example.com" in emails(reader)
@@ -0,0 +1,126 @@
+"""
+FAVORITOS_WRITE_BEHIND=1: favorite changes answered 202, coalesced in memory
+and written in batches; reads flush the user's queue first.
+"""
+import pytest
+
+import writebehind
+
+
+@pytest.fixture
+def queued_app(make_app, catalog):
+    # un intervalo largo: solo se escribe al leer, al llenar el lote o con flush()
+    app = make_app(FAVORITOS_WRITE_BEHIND=True, FAVORITOS_FLUSH_MS=3600 * 1000)
+    catalog(app, 3)
+    return app
+
+
+def favoritos(client, user_id=1):
+    return client.get("/users/%d/favoritos?all=true" % user_id).get_json()["results"]
+
+
+def stored_count(app):
+    from models import db, Favorito
+    with app.app_context():
+        return db.session.query(Favorito).count()
+
+
+def test_add_is_queued_and_visible_to_the_next_read(queued_app):
+    client = queued_app.test_client()
+
+    response = client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    assert response.status_code == 202
+    assert stored_count(queued_app) == 0
+    assert [item["characters"] for item in favoritos(client)] == ["Character 0"]
+    assert stored_count(queued_app) == 1
+
+
+def test_add_then_delete_cancels_out(queued_app):
+    client = queued_app.test_client()
+    queue = queued_app.extensions["favoritos_write_behind"]
+    cancelled = writebehind.CANCELLED.value()
+
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+    response = client.delete("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    assert response.status_code == 202
+    assert queue.pending == {}
+    assert writebehind.CANCELLED.value() == cancelled + 1
+    assert favoritos(client) == []
+
+
+def test_repeated_changes_answer_like_the_table(queued_app):
+    client = queued_app.test_client()
+    body = {"characters_id": 2, "planets_id": None}
+
+    assert client.delete("/users/1/favoritos/", json=body).status_code == 404
+    assert client.post("/users/1/favoritos/", json=body).status_code == 202
+    assert client.post("/users/1/favoritos/", json=body).status_code == 409
+    queued_app.extensions["favoritos_write_behind"].flush()
+    assert client.post("/users/1/favoritos/", json=body).status_code == 409
+
+
+@pytest.mark.parametrize("user_id, body, status", [
+    (9, {"characters_id": 1, "planets_id": None}, 404),
+    (1, {"characters_id": 99, "planets_id": None}, 400),
+    (1, {"characters_id": "1", "planets_id": None}, 400),
+    (1, {"characters_id": None, "planets_id": None}, 400),
+])
+def test_changes_that_cannot_be_written_are_rejected_before_queueing(queued_app, user_id, body, status):
+    client = queued_app.test_client()
+
+    assert client.post("/users/%d/favoritos/" % user_id, json=body).status_code == status
+    assert queued_app.extensions["favoritos_write_behind"].pending == {}
+
+
+def test_delete_after_a_flush_that_raced_the_table_read(queued_app, monkeypatch):
+    queue = queued_app.extensions["favoritos_write_behind"]
+    client = queued_app.test_client()
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+    read_table = writebehind.stored
+
+    def flush_right_after(key):
+        # el flush termina entre la consulta de change() y su lock
+        found = read_table(key)
+        monkeypatch.setattr(writebehind, "stored", read_table)
+        queue.flush()
+        return found
+
+    monkeypatch.setattr(writebehind, "stored", flush_right_after)
+    response = client.delete("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    assert response.status_code == 202
+    assert favoritos(client) == []
+
+
+def test_failed_changes_count_as_dropped_not_flushed(queued_app, monkeypatch):
+    from models import Favorito
+    queue = queued_app.extensions["favoritos_write_behind"]
+    client = queued_app.test_client()
+    flushed, dropped = writebehind.FLUSHED.value(), writebehind.DROPPED.value()
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+    client.post("/users/2/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    real_bulk_add = Favorito.bulk_add
+
+    def fail_for_user_2(user_id, items):
+        if user_id == 2:
+            raise RuntimeError("write failed")
+        return real_bulk_add(user_id, items)
+
+    monkeypatch.setattr(Favorito, "bulk_add", staticmethod(fail_for_user_2))
+
+    assert queue.flush() == 1
+    assert writebehind.FLUSHED.value() == flushed + 1
+    assert writebehind.DROPPED.value() == dropped + 1
+    assert stored_count(queued_app) == 1
+
+
+def test_batch_endpoints_see_queued_changes(queued_app):
+    client = queued_app.test_client()
+    client.post("/users/1/favoritos/", json={"characters_id": 1, "planets_id": None})
+
+    response = client.post("/users/1/favoritos/batch", json=[{"characters_id": 1, "planets_id": None}])
+
+    assert [item["result"] for item in response.get_json()["results"]] == ["exists"]